@@ -0,0 +1,288 @@
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from carts.models import Cart
+from carts.utils import MAX_CART_QUANTITY, CartSnapshot, fold_cart_operations, parse_cart_quantity, touch_cart
+from goods.models import Products
+
+
+class CartLine:
+    """Позиция корзины, которая хранится не в таблице cart (см. SessionCart); id позиции - id товара."""
+
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+        self.line_price = product.sell_price * quantity
+
+
+class BaseCart:
+    """
+    Хранилище корзины текущего посетителя. Представления и шаблоны работают только через
+    snapshot(), add(), change() и remove(), не зная, где лежат позиции.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    def add(self, product_id):
+        """Добавляет единицу товара и возвращает id позиции."""
+        raise NotImplementedError
+
+    def change(self, cart_id, quantity):
+        """Устанавливает количество позиции (InvalidCartOperation, если оно неверное) и возвращает его."""
+        raise NotImplementedError
+
+    def remove(self, cart_id):
+        """Удаляет позицию и возвращает ее количество."""
+        raise NotImplementedError
+
+    def delta(self, line_id):
+        """
+        Изменение корзины для ответа без HTML: позиция line_id (None, если ее больше нет)
+        и новые итоги корзины.
+        """
+        snapshot = get_cart_snapshot(self.request)
+        line = next((item for item in snapshot if str(item.id) == str(line_id)), None)
+        return {
+            'line': line and {'id': line.id, 'quantity': line.quantity, 'line_price': line.line_price},
+            'total_quantity': snapshot.total_quantity,
+            'total_price': snapshot.total_price,
+        }
+
+    def batch(self, operations):
+        """Применяет операции из parse_cart_operations разом и возвращает id затронутых товаров."""
+        raise NotImplementedError
+
+    def state(self, product_ids):
+        """Позиции с этими товарами и итоги корзины - ответ на пакетное изменение без HTML."""
+        snapshot = get_cart_snapshot(self.request)
+        product_ids = set(product_ids)
+        return {
+            'lines': [
+                {'id': line.id, 'product_id': line.product.id, 'quantity': line.quantity,
+                 'line_price': line.line_price}
+                for line in snapshot if line.product.id in product_ids
+            ],
+            'total_quantity': snapshot.total_quantity,
+            'total_price': snapshot.total_price,
+        }
+
+    def changed(self):
+        # снимок, взятый в этом запросе раньше, больше не актуален
+        self.request._cart_snapshot = None
+
+
+class DatabaseCart(BaseCart):
+    """
+    Корзина авторизованного пользователя в таблице cart. add() и change() - по одной команде
+    без сигналов, поэтому метку изменения корзины ставит changed().
+    """
+
+    def changed(self):
+        super().changed()
+        touch_cart(user_id=self.request.user.id)
+
+    def get_queryset(self):
+        return Cart.objects.filter(user=self.request.user)
+
+    def snapshot(self):
+        return CartSnapshot.from_queryset(
+            self.get_queryset().select_related('product').defer('product__search_vector')
+        )
+
+    def add(self, product_id):
+        try:
+            # savepoint: ошибка внешнего ключа (нет такого товара) не должна ломать внешнюю транзакцию
+            with transaction.atomic():
+                cart_id, _ = Cart.objects.add_product(product_id, user_id=self.request.user.id)
+        except IntegrityError:
+            raise Http404()
+        self.changed()
+        return cart_id
+
+    def change(self, cart_id, quantity):
+        quantity = parse_cart_quantity(quantity)
+        if not self.get_queryset().filter(id=cart_id).update(quantity=quantity):
+            raise Http404()
+        self.changed()
+        return quantity
+
+    def remove(self, cart_id):
+        cart = get_object_or_404(self.get_queryset(), id=cart_id)
+        cart.delete()
+        self.changed()
+        return cart.quantity
+
+    def batch(self, operations):
+        """
+        Не больше пяти команд на любой пакет: блокировка строк, указанных по cart_id,
+        одна вставка с прибавкой, одна с заменой количества и удаление.
+        """
+        user_id = self.request.user.id
+        try:
+            with transaction.atomic():
+                cart_ids = {key for _, kind, key, _ in operations if kind == 'cart'}
+                products = {}
+                if cart_ids:
+                    # строки блокируются до конца транзакции, параллельный запрос их не удалит
+                    products = dict(self.get_queryset().filter(id__in=cart_ids)
+                                    .select_for_update().values_list('id', 'product_id'))
+                    if len(products) != len(cart_ids):
+                        raise Http404()
+
+                actions = fold_cart_operations([
+                    (op, products[key] if kind == 'cart' else key, quantity)
+                    for op, kind, key, quantity in operations
+                ])
+                added = [(product_id, quantity) for product_id, (action, quantity) in actions.items()
+                         if action == 'add']
+                replaced = [(product_id, quantity) for product_id, (action, quantity) in actions.items()
+                            if action == 'set']
+                removed = [product_id for product_id, (action, _) in actions.items() if action == 'remove']
+
+                if added:
+                    Cart.objects.upsert_products(added, user_id=user_id)
+                if replaced:
+                    Cart.objects.upsert_products(replaced, user_id=user_id, replace=True)
+                if removed:
+                    self.get_queryset().filter(product_id__in=removed).delete()
+        except IntegrityError:
+            # нет такого товара - весь пакет откатывается
+            raise Http404()
+        self.changed()
+        return list(actions)
+
+    def state(self, product_ids):
+        lines = self.get_queryset().filter(product_id__in=product_ids).with_line_price()
+        totals = self.get_queryset().totals()
+        return {
+            'lines': list(lines.values('id', 'product_id', 'quantity', 'line_price')),
+            'total_quantity': totals['total_quantity'],
+            'total_price': totals['total_price'],
+        }
+
+    def delta(self, line_id):
+        # итоги и строка одним агрегатом, без выборки всех позиций
+        totals = self.get_queryset().totals(line_id=line_id)
+        line = None
+        if totals['line_quantity'] is not None:
+            line = {'id': int(line_id), 'quantity': totals['line_quantity'], 'line_price': totals['line_price']}
+        return {'line': line, 'total_quantity': totals['total_quantity'], 'total_price': totals['total_price']}
+
+
+class SessionCart(BaseCart):
+    """
+    Корзина гостя в сессии: {id товара: количество}. Пока гость ничего не положил в корзину,
+    сессия не создается; строки в таблице cart появляются только после входа или регистрации
+    (promote_anonymous_cart).
+    """
+    session_field = 'cart'
+
+    @property
+    def items(self):
+        # ключи - строки, так их сохраняет JSON-сериализатор сессии
+        return self.request.session.get(self.session_field, {})
+
+    def save(self, items):
+        session = self.request.session
+        session[self.session_field] = items
+        if not session.session_key:
+            session.save()
+        touch_cart(session_key=session.session_key)
+        self.changed()
+
+    def snapshot(self):
+        items = self.items
+        if not items:
+            return CartSnapshot.from_lines([])
+        products = Products.objects.in_bulk([int(product_id) for product_id in items])
+        return CartSnapshot.from_lines([
+            CartLine(products[int(product_id)], quantity)
+            for product_id, quantity in items.items() if int(product_id) in products
+        ])
+
+    def add(self, product_id):
+        if not Products.objects.filter(id=product_id).exists():
+            raise Http404()
+        items = dict(self.items)
+        items[str(product_id)] = min(items.get(str(product_id), 0) + 1, MAX_CART_QUANTITY)
+        self.save(items)
+        return product_id
+
+    def change(self, cart_id, quantity):
+        quantity = parse_cart_quantity(quantity)
+        items = dict(self.items)
+        if str(cart_id) not in items:
+            raise Http404()
+        items[str(cart_id)] = quantity
+        self.save(items)
+        return items[str(cart_id)]
+
+    def remove(self, cart_id):
+        items = dict(self.items)
+        if str(cart_id) not in items:
+            raise Http404()
+        quantity = items.pop(str(cart_id))
+        self.save(items)
+        return quantity
+
+    def batch(self, operations):
+        items = dict(self.items)
+        # id позиции гостя - это id товара
+        if any(kind == 'cart' and str(key) not in items for _, kind, key, _ in operations):
+            raise Http404()
+        actions = fold_cart_operations([(op, key, quantity) for op, _, key, quantity in operations])
+
+        new_ids = {product_id for product_id, (action, _) in actions.items()
+                   if action != 'remove' and str(product_id) not in items}
+        if new_ids and Products.objects.filter(id__in=new_ids).count() != len(new_ids):
+            raise Http404()
+
+        for product_id, (action, quantity) in actions.items():
+            if action == 'remove':
+                items.pop(str(product_id), None)
+            elif action == 'set':
+                items[str(product_id)] = quantity
+            else:
+                items[str(product_id)] = min(items.get(str(product_id), 0) + quantity, MAX_CART_QUANTITY)
+        self.save(items)
+        return list(actions)
+
+    def clear(self):
+        if self.session_field in self.request.session:
+            del self.request.session[self.session_field]
+            self.changed()
+
+
+def get_cart_backend(request):
+    if request.user.is_authenticated:
+        return DatabaseCart(request)
+    return SessionCart(request)
+
+
+def get_cart_snapshot(request):
+    # все фрагменты страницы (кнопка корзины, профиль, оформление заказа) берут корзину отсюда
+    snapshot = getattr(request, '_cart_snapshot', None)
+    if snapshot is None:
+        snapshot = request._cart_snapshot = get_cart_backend(request).snapshot()
+    return snapshot
+
+
+def promote_anonymous_cart(request, user, session_key):
+    """
+    После входа или регистрации: корзина гостя (из сессии и старые строки cart с session_key)
+    сливается с корзиной пользователя, количество одинаковых товаров суммируется.
+    """
+    session_cart = SessionCart(request)
+    items = session_cart.items
+    if not items and not session_key:
+        return
+
+    Cart.objects.merge_into_user(user.id, session_key, items)
+    session_cart.clear()
+    touch_cart(user_id=user.id)
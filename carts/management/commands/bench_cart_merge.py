@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from carts.models import Cart
+from goods.management.commands._bench import seed_products
+from goods.models import Products
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Проверяет и замеряет слияние корзины гостя с корзиной пользователя (Cart.objects.merge_into_user) '
+            'на корзинах разного размера. Тестовые данные создаются внутри транзакции, которая в конце откатывается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('sizes', nargs='*', type=int, default=[10, 100, 1000, 10_000])
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            seed_products(max(options['sizes']) * 2)
+            user = User.objects.create_user('bench-cart-merge')
+            products = list(Products.objects.filter(slug__startswith='bench-product-')
+                            .order_by('id').values_list('id', flat=True))
+
+            self.check_merge(user, products)
+            for size in options['sizes']:
+                self.bench(user, products, size, options['repeat'])
+
+            transaction.set_rollback(True)
+
+    def merge(self, user, user_products, session_products, legacy_products):
+        """Заполняет обе корзины (по 2 штуки каждого товара) и сливает их; возвращает время слияния в мс."""
+        Cart.objects.filter(user=user).delete()
+        Cart.objects.bulk_create(
+            [Cart(user=user, product_id=product_id, quantity=2) for product_id in user_products]
+            + [Cart(session_key='bench', product_id=product_id, quantity=2) for product_id in legacy_products]
+        )
+        items = {str(product_id): 2 for product_id in session_products}
+        start = time.perf_counter()
+        Cart.objects.merge_into_user(user.id, 'bench', items)
+        return (time.perf_counter() - start) * 1000
+
+    def check_merge(self, user, products):
+        # без пересечения: все товары гостя добавляются к корзине пользователя
+        self.merge(user, products[:3], products[3:5], products[5:6])
+        self.expect(user, {product_id: 2 for product_id in products[:6]})
+        # с пересечением: количество одинаковых товаров складывается, в том числе из сессии и старых строк
+        self.merge(user, products[:3], products[1:4], products[2:5])
+        self.expect(user, {products[0]: 2, products[1]: 4, products[2]: 6, products[3]: 4, products[4]: 2})
+        self.stdout.write(self.style.SUCCESS('Слияние с пересечением и без дает ожидаемые количества'))
+
+    def expect(self, user, expected):
+        actual = dict(Cart.objects.filter(user=user).values_list('product_id', 'quantity'))
+        if actual != expected:
+            raise CommandError(f'Ожидалось {expected}, получено {actual}')
+        if Cart.objects.filter(session_key='bench').exists():
+            raise CommandError('Строки гостя не удалены')
+
+    def bench(self, user, products, size, repeat):
+        # половина товаров гостя уже есть в корзине пользователя; гость - наполовину сессия, наполовину старые строки
+        user_products = products[:size]
+        guest_products = products[size // 2:size // 2 + size]
+        timings = []
+        for _ in range(repeat):
+            savepoint = transaction.savepoint()
+            timings.append(self.merge(user, user_products, guest_products[::2], guest_products[1::2]))
+            transaction.savepoint_rollback(savepoint)
+        self.stdout.write(f'{size} позиций: {statistics.median(timings):.1f} мс (мин. {min(timings):.1f})')
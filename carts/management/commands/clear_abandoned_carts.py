@@ -0,0 +1,67 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from carts.models import Cart
+
+# каждая пачка - одна короткая команда: строки, которые сейчас заблокированы (корзину меняют), пропускаются
+DELETE_CARTS_SQL = '''
+    DELETE FROM {table} WHERE id IN (
+        SELECT id FROM {table} WHERE user_id IS NULL AND created_timestamp < %s
+        ORDER BY created_timestamp, id LIMIT %s FOR UPDATE SKIP LOCKED
+    )
+'''
+DELETE_SESSIONS_SQL = '''
+    DELETE FROM {table} WHERE session_key IN (
+        SELECT session_key FROM {table} WHERE expire_date < %s LIMIT %s FOR UPDATE SKIP LOCKED
+    )
+'''
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+class Command(BaseCommand):
+    help = ('Удаляет брошенные корзины гостей (строки cart без пользователя старше --days) '
+            'и истекшие сессии небольшими пачками, без долгих блокировок. '
+            'С --loop работает постоянно')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Возраст корзины гостя, после которого она удаляется')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.05, help='Пауза между пачками, с')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Повторять очистку с этим интервалом, пока команду не остановят')
+
+    def handle(self, *args, **options):
+        while True:
+            self.clear(
+                'корзин гостей', DELETE_CARTS_SQL.format(table=Cart._meta.db_table),
+                timezone.now() - timedelta(days=options['days']), options,
+            )
+            if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+                self.clear(
+                    'истекших сессий', DELETE_SESSIONS_SQL.format(table=Session._meta.db_table),
+                    timezone.now(), options,
+                )
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
+
+    def clear(self, name, sql, before, options):
+        started = time.monotonic()
+        total = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [before, options['batch_size']])
+                deleted = cursor.rowcount
+            total += deleted
+            if deleted < options['batch_size']:
+                break
+            time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'Удалено {total} {name} за {elapsed:.1f} с ({total / max(elapsed, 1e-6):.0f} строк/с)')
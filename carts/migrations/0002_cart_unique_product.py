@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+# до ограничений уникальности сливаем повторяющиеся строки: количество суммируется в строку с меньшим id
+MERGE_DUPLICATES_SQL = '''
+UPDATE cart SET quantity = merged.quantity
+FROM (
+    SELECT min(id) AS id, least(sum(quantity), 32767) AS quantity
+    FROM cart WHERE {owner} IS NOT NULL
+    GROUP BY {owner}, product_id HAVING count(*) > 1
+) AS merged
+WHERE cart.id = merged.id;
+
+DELETE FROM cart USING cart AS kept
+WHERE cart.{owner} = kept.{owner} AND cart.product_id = kept.product_id AND cart.id > kept.id;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0001_initial'),
+        ('goods', '0011_search_query_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES_SQL.format(owner='user_id'), migrations.RunSQL.noop),
+        migrations.RunSQL(MERGE_DUPLICATES_SQL.format(owner='session_key'), migrations.RunSQL.noop),
+        migrations.AlterModelOptions(
+            name='cart',
+            options={'ordering': ('id',), 'verbose_name': 'Корзина', 'verbose_name_plural': 'Корзина'},
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_user_product_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('session_key', 'product'), name='cart_session_product_unique'),
+        ),
+    ]
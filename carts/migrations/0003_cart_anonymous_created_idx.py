@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:23
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в cart, но не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('carts', '0002_cart_unique_product'),
+        ('goods', '0011_search_query_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('user__isnull', True)), fields=['created_timestamp', 'id'], name='cart_anonymous_created_idx'),
+        ),
+    ]
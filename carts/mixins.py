@@ -1,28 +1,14 @@
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.formats import localize
 
-from carts.models import Cart
-from carts.utils import get_user_carts
+from carts.backends import get_cart_backend, get_cart_snapshot
 
 
 class CartMixin:
-    def get_cart(self, request, product=None, cart_id=None):
-        if request.user.is_authenticated:
-            query_kwargs = {'user': request.user}
-        else:
-            query_kwargs = {'session_key': request.session.session_key}
-
-        if product:
-            query_kwargs['product'] = product
-
-        if cart_id:
-            query_kwargs['id'] = cart_id
-
-        return Cart.objects.filter(**query_kwargs).first()
-
     def render_cart(self, request):
-        user_cart = get_user_carts(request)
-        context = {'carts': user_cart}
+        # хранилище сбрасывает снимок при изменении, здесь корзина читается уже новая
+        context = {'carts': get_cart_snapshot(request)}
 
         referer = request.META.get('HTTP_REFERER')
         if reverse('orders:create_order') in referer:
@@ -31,3 +17,44 @@ class CartMixin:
         return render_to_string(
             'carts/includes/included_cart.html', context, request=request
         )
+
+    @staticmethod
+    def wants_delta(request):
+        # клиент, который умеет править корзину на месте, присылает delta=1
+        return request.POST.get('delta') == '1'
+
+    def cart_response_data(self, request, line_id):
+        """
+        Данные о корзине для ответа: только измененная позиция и итоги (delta=1)
+        или, как раньше, весь фрагмент корзины в cart_items_html.
+        """
+        if not self.wants_delta(request):
+            return {'cart_items_html': self.render_cart(request)}
+
+        delta = get_cart_backend(request).delta(line_id)
+        line = delta['line']
+        if line:
+            # суммы в том же виде, в каком их выводит шаблон корзины
+            line = {'id': line['id'], 'quantity': line['quantity'], 'line_price': localize(line['line_price'])}
+        return {
+            'line_id': int(line_id),
+            'line': line,
+            'total_quantity': delta['total_quantity'],
+            'total_price': localize(delta['total_price']),
+        }
+
+    def cart_state_data(self, request, product_ids):
+        """То же для пакетного изменения: позиции с затронутыми товарами и итоги или весь фрагмент."""
+        if not self.wants_delta(request):
+            return {'cart_items_html': self.render_cart(request)}
+
+        state = get_cart_backend(request).state(product_ids)
+        lines = [{**line, 'line_price': localize(line['line_price'])} for line in state['lines']]
+        # товары, которых после изменения в корзине нет, клиент убирает со страницы
+        present = {line['product_id'] for line in lines}
+        return {
+            'lines': lines,
+            'removed': [product_id for product_id in product_ids if product_id not in present],
+            'total_quantity': state['total_quantity'],
+            'total_price': localize(state['total_price']),
+        }
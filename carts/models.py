@@ -1,19 +1,121 @@
 import uuid
 
-from django.db import models
+from django.db import connections, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum, Window
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from users.models import User
 from goods.models import Products
 
 
+def line_price_expression():
+    # sell_price уже округлена в БД до копеек, умножение на целое количество округления не требует
+    return ExpressionWrapper(
+        F('product__sell_price') * F('quantity'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
 class CartQuerySet(models.QuerySet):
+    def with_line_price(self):
+        return self.annotate(line_price=line_price_expression())
+
+    def with_totals(self):
+        """Строки корзины с суммой по строке и итогами по всей выборке в каждой строке (оконные SUM)."""
+        return self.with_line_price().annotate(
+            cart_total_quantity=Window(Sum('quantity')),
+            cart_total_price=Window(Sum(line_price_expression())),
+        )
+
+    def totals(self, line_id=None):
+        """
+        Обе суммы одним запросом; пустая корзина дает 0, как и раньше.
+        С line_id в том же запросе - количество и сумма этой строки (None, если строки нет).
+        """
+        sums = {
+            'total_quantity': Coalesce(Sum('quantity'), 0),
+            'total_price': Coalesce(Sum(line_price_expression()), 0,
+                                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+        }
+        if line_id is not None:
+            sums['line_quantity'] = Sum('quantity', filter=Q(id=line_id))
+            sums['line_price'] = Sum(line_price_expression(), filter=Q(id=line_id))
+        return self.aggregate(**sums)
+
+    def add_product(self, product_id, user_id=None, session_key=None, quantity=1):
+        """
+        Добавляет товар в корзину одной командой INSERT ... ON CONFLICT DO UPDATE:
+        параллельные добавления не создают вторую строку и не теряют прибавку.
+        Возвращает (id, quantity) строки. Сигналы post_save не отправляются.
+        """
+        (cart_id, _, quantity), = self.upsert_products([(product_id, quantity)], user_id, session_key)
+        return cart_id, quantity
+
+    def upsert_products(self, rows, user_id=None, session_key=None, replace=False):
+        """
+        Несколько товаров [(product_id, quantity), ...] одной командой: количество прибавляется
+        к уже лежащему в корзине (не больше 32767) или, с replace=True, заменяет его.
+        Товары в rows не повторяются.
+        Возвращает [(id, product_id, quantity), ...].
+        """
+        table = self.model._meta.db_table
+        owner = 'user_id' if user_id else 'session_key'
+        # сумма двух smallint переполняется раньше least(), поэтому складываем в integer
+        quantity = 'EXCLUDED.quantity' if replace else f'least({table}.quantity::integer + EXCLUDED.quantity, 32767)'
+        sql = f'''
+            INSERT INTO {table} (user_id, session_key, product_id, quantity, created_timestamp)
+            VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))}
+            ON CONFLICT ({owner}, product_id) DO UPDATE SET quantity = {quantity}
+            RETURNING id, product_id, quantity
+        '''
+        now = timezone.now()
+        params = []
+        for product_id, product_quantity in rows:
+            params += [user_id, session_key if not user_id else None, product_id, product_quantity, now]
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def merge_into_user(self, user_id, session_key=None, items=None):
+        """
+        Сливает корзину гостя с корзиной пользователя одной командой: строки cart с session_key
+        и позиции из сессии items ({id товара: количество}) прибавляются к его строкам,
+        количество одинаковых товаров суммируется. Строки гостя удаляются, товары, которых
+        уже нет в каталоге, пропускаются. Возвращает число вставленных или обновленных строк.
+        """
+        table = self.model._meta.db_table
+        product_table = Products._meta.db_table
+        items = items or {}
+        sql = f'''
+            WITH guest AS (
+                DELETE FROM {table} WHERE session_key = %s AND user_id IS NULL
+                RETURNING product_id, quantity
+            ), incoming AS (
+                SELECT product_id, quantity FROM guest
+                UNION ALL
+                SELECT * FROM unnest(%s::integer[], %s::integer[])
+            )
+            INSERT INTO {table} (user_id, session_key, product_id, quantity, created_timestamp)
+            SELECT %s, NULL, incoming.product_id, least(sum(incoming.quantity), 32767), %s
+            FROM incoming JOIN {product_table} ON {product_table}.id = incoming.product_id
+            GROUP BY incoming.product_id
+            ON CONFLICT (user_id, product_id) DO UPDATE
+            SET quantity = least({table}.quantity::integer + EXCLUDED.quantity, 32767)
+        '''
+        params = [
+            session_key, [int(product_id) for product_id in items], [int(quantity) for quantity in items.values()],
+            user_id, timezone.now(),
+        ]
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
     def total_price(self):
-        return sum(cart.products_price() for cart in self)
+        return self.totals()['total_price']
 
     def total_quantity(self):
-        if self:
-            return sum(cart.quantity for cart in self)
-        return 0
+        return self.totals()['total_quantity']
 
 
 class Cart(models.Model):
@@ -28,11 +130,22 @@ class Cart(models.Model):
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
         ordering = ('id',)
+        constraints = [
+            # нужны для ON CONFLICT в CartQuerySet.add_product
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_user_product_unique'),
+            models.UniqueConstraint(fields=['session_key', 'product'], name='cart_session_product_unique'),
+        ]
+        indexes = [
+            # поиск по session_key идет по индексу ограничения cart_session_product_unique;
+            # этот - для очистки брошенных корзин гостей (manage.py clear_abandoned_carts)
+            models.Index(fields=['created_timestamp', 'id'], condition=Q(user__isnull=True),
+                         name='cart_anonymous_created_idx'),
+        ]
 
     objects = CartQuerySet.as_manager()
 
     def products_price(self):
-        return round(self.product.sell_price() * self.quantity, 2)
+        return round(self.product.sell_price * self.quantity, 2)
 
     def __str__(self):
         if self.user:
@@ -1,9 +1,9 @@
 from django import template
-from carts.utils import get_user_carts
+from carts.backends import get_cart_snapshot
 
 register = template.Library()
 
 
 @register.simple_tag()
 def user_carts(request):
-    return get_user_carts(request)
+    return get_cart_snapshot(request)
@@ -1,3 +1,308 @@
-from django.test import TestCase
+import threading
+from decimal import ROUND_HALF_UP, Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from carts.models import Cart
+from goods.models import Categories, Products
+from goods.utils import VersionedLocalCache
+from users.models import User
+
+
+def reset_local_caches():
+    # значения в памяти процесса могли собраться в другом тесте по другим данным
+    cache.clear()
+    for local_cache in VersionedLocalCache.instances:
+        local_cache.expire()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CartSnapshotQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.user = User.objects.create_user('buyer', password='x')
+        # bulk_create без сигналов: уменьшенные копии картинок (goods.images) в тестах не нужны
+        products = Products.objects.bulk_create(
+            Products(name=f'Стол {i}', slug=f'stol-{i}', image=f'goods_images/stol-{i}.jpg', price=100 + i,
+                     quantity=10, category=category)
+            for i in range(5)
+        )
+        Cart.objects.bulk_create(
+            Cart(user=cls.user, product=product, quantity=i + 1) for i, product in enumerate(products)
+        )
+
+    def setUp(self):
+        reset_local_caches()
+        self.client.force_login(self.user)
+
+    def test_one_cart_query_per_page(self):
+        # страницы со значком корзины (счетчик и корзина в модальном окне) и со страничными фрагментами корзины
+        pages = [
+            (reverse('catalog:index', kwargs={'category_slug': 'stoly'}), 6),
+            (reverse('catalog:product', kwargs={'product_slug': 'stol-0'}), 4),
+            (reverse('user:profile'), 4),
+            (reverse('user:users_cart'), 3),
+            (reverse('orders:create_order'), 3),
+        ]
+        for url, total in pages:
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(total) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                cart_queries = [query for query in queries.captured_queries if 'FROM "cart"' in query['sql']]
+                self.assertEqual(len(cart_queries), 1)
+                self.assertContains(response, 'cart-total-quantity">15<')
+
+    def test_fragments_share_snapshot(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = self.client.session
+        template = Template(
+            '{% load carts_tags %}'
+            '{% user_carts request as button %}{{ button.total_quantity }}'
+            '{% user_carts request as carts %}{% include "carts/includes/included_cart.html" %}'
+            '{% user_carts request as summary %}{{ summary.total_price }}'
+        )
+        with self.assertNumQueries(1):
+            html = template.render(Context({'request': request}))
+        self.assertEqual(html.count('data-cart-line='), 10)
+
+
+class CartTotalsTest(TestCase):
+    prices = ['0.01', '0.99', '1.05', '9.99', '19.95', '99.99', '123.45', '1000.00', '4999.99', '99999.99']
+    discounts = ['0', '0.01', '0.50', '1', '2.50', '5', '7.77', '10', '12.50', '15', '25', '33.33', '33.34',
+                 '49.99', '50', '66.67', '75', '90', '99.99']
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.user = User.objects.create_user('buyer', password='x')
+        cls.empty_user = User.objects.create_user('window-shopper', password='x')
+        products = Products.objects.bulk_create(
+            Products(name=f'Товар {price} {discount}', slug=f'product-{i}-{j}', price=Decimal(price),
+                     discount=Decimal(discount), category=category)
+            for i, price in enumerate(cls.prices) for j, discount in enumerate(cls.discounts)
+        )
+        Cart.objects.bulk_create(
+            Cart(user=cls.user, product=product, quantity=i % 7 + 1) for i, product in enumerate(products)
+        )
+
+    @staticmethod
+    def expected_line_price(cart):
+        # та же формула, что у Products.sell_price: цена со скидкой, округленная до копеек
+        price, discount = cart.product.price, cart.product.discount
+        sell_price = (price - price * discount / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return sell_price * cart.quantity
+
+    def test_line_prices(self):
+        carts = Cart.objects.filter(user=self.user).select_related('product').with_line_price()
+        self.assertEqual(len(carts), len(self.prices) * len(self.discounts))
+        for cart in carts:
+            with self.subTest(price=cart.product.price, discount=cart.product.discount):
+                self.assertEqual(cart.line_price, self.expected_line_price(cart))
+
+    def test_totals(self):
+        carts = list(Cart.objects.filter(user=self.user).select_related('product'))
+        expected_price = sum(self.expected_line_price(cart) for cart in carts)
+        expected_quantity = sum(cart.quantity for cart in carts)
+
+        with self.assertNumQueries(1):
+            totals = Cart.objects.filter(user=self.user).totals()
+        self.assertEqual(totals, {'total_quantity': expected_quantity, 'total_price': expected_price})
+
+        for cart in Cart.objects.filter(user=self.user).select_related('product').with_totals():
+            self.assertEqual(cart.line_price, self.expected_line_price(cart))
+            self.assertEqual(cart.cart_total_quantity, expected_quantity)
+            self.assertEqual(cart.cart_total_price, expected_price)
+
+    def test_empty_cart(self):
+        carts = Cart.objects.filter(user=self.empty_user)
+        self.assertEqual(carts.totals(), {'total_quantity': 0, 'total_price': 0})
+        self.assertEqual(carts.total_price(), 0)
+        self.assertEqual(carts.total_quantity(), 0)
+        self.assertEqual(list(carts.with_totals()), [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CartChangeValidationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.product = Products.objects.create(name='Стол', slug='stol', price=100, category=category)
+        cls.user = User.objects.create_user('buyer', password='x')
+        cls.cart = Cart.objects.create(user=cls.user, product=cls.product, quantity=2)
+
+    def test_invalid_quantity(self):
+        guest = self.client_class()
+        guest.post(reverse('cart:cart_add'), {'product_id': self.product.id}, HTTP_REFERER='/')
+        self.client.force_login(self.user)
+
+        for quantity in (None, '', 'abc', '0', '-3', '32768'):
+            data = {} if quantity is None else {'quantity': quantity}
+            with self.subTest(quantity=quantity):
+                response = self.client.post(reverse('cart:cart_change'), {'cart_id': self.cart.id, **data},
+                                            HTTP_REFERER='/')
+                self.assertEqual(response.status_code, 400)
+                response = guest.post(reverse('cart:cart_change'), {'cart_id': self.product.id, **data},
+                                      HTTP_REFERER='/')
+                self.assertEqual(response.status_code, 400)
+
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.quantity, 2)
+        self.assertEqual(guest.session['cart'], {str(self.product.id): 1})
+
+    def test_guest_add_is_capped(self):
+        session = self.client.session
+        session['cart'] = {str(self.product.id): 32767}
+        session.save()
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.product.id}, HTTP_REFERER='/')
+        self.assertEqual(self.client.session['cart'], {str(self.product.id): 32767})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CartMergeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.products = [
+            product.id for product in Products.objects.bulk_create(
+                Products(name=f'Стол {i}', slug=f'stol-{i}', price=100, category=category) for i in range(6)
+            )
+        ]
+        cls.user = User.objects.create_user('buyer', password='Sloz-Parol-2024')
+
+    def setUp(self):
+        reset_local_caches()
+
+    def merge(self, user_products, session_products, legacy_products, session_key='guest-session'):
+        # по 2 штуки каждого товара: у пользователя, в сессии гостя и в старых строках cart с session_key
+        Cart.objects.bulk_create(
+            [Cart(user=self.user, product_id=product_id, quantity=2) for product_id in user_products]
+            + [Cart(session_key=session_key, product_id=product_id, quantity=2) for product_id in legacy_products]
+        )
+        items = {str(product_id): 2 for product_id in session_products}
+        Cart.objects.merge_into_user(self.user.id, session_key, items)
+
+    def user_cart(self):
+        return dict(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def test_disjoint(self):
+        products = self.products
+        self.merge(products[:2], products[2:4], products[4:6])
+        self.assertEqual(self.user_cart(), {product_id: 2 for product_id in products})
+        self.assertFalse(Cart.objects.filter(session_key='guest-session').exists())
+
+    def test_overlapping(self):
+        products = self.products
+        # products[2] есть и у пользователя, и в сессии, и в старых строках гостя
+        self.merge(products[:3], products[1:4], products[2:5])
+        self.assertEqual(self.user_cart(), {
+            products[0]: 2, products[1]: 4, products[2]: 6, products[3]: 4, products[4]: 2,
+        })
+        self.assertFalse(Cart.objects.filter(session_key='guest-session').exists())
+
+    def test_missing_products_skipped(self):
+        # товар из сессии гостя успели удалить из каталога
+        missing = max(self.products) + 1000
+        self.merge(self.products[:1], [missing, self.products[1]], [])
+        self.assertEqual(self.user_cart(), {self.products[0]: 2, self.products[1]: 2})
+
+    def guest_with_cart(self):
+        guest = self.client_class()
+        guest.post(reverse('cart:cart_add'), {'product_id': self.products[0]}, HTTP_REFERER='/')
+        guest.post(reverse('cart:cart_add'), {'product_id': self.products[1]}, HTTP_REFERER='/')
+        Cart.objects.create(session_key=guest.session.session_key, product_id=self.products[1], quantity=2)
+        return guest
+
+    def test_login_merges_cart(self):
+        Cart.objects.create(user=self.user, product_id=self.products[0], quantity=3)
+        guest = self.guest_with_cart()
+        response = guest.post(reverse('user:login'), {'username': 'buyer', 'password': 'Sloz-Parol-2024'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.user_cart(), {self.products[0]: 4, self.products[1]: 3})
+        self.assertFalse(Cart.objects.filter(user__isnull=True).exists())
+        self.assertFalse(guest.session.get('cart'))
+
+    def test_registration_merges_cart(self):
+        guest = self.guest_with_cart()
+        response = guest.post(reverse('user:registration'), {
+            'first_name': 'Иван', 'last_name': 'Петров', 'username': 'newbie', 'email': 'newbie@example.com',
+            'password1': 'Sloz-Parol-2024', 'password2': 'Sloz-Parol-2024',
+        })
+        self.assertEqual(response.status_code, 302)
+        carts = Cart.objects.filter(user__username='newbie').values_list('product_id', 'quantity')
+        self.assertEqual(dict(carts), {self.products[0]: 1, self.products[1]: 3})
+        self.assertFalse(Cart.objects.filter(user__isnull=True).exists())
+
+
+class CartUpsertCapTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.product = Products.objects.create(name='Стол', slug='stol', price=100, category=category)
+        cls.user = User.objects.create_user('buyer', password='x')
+
+    def test_add_is_capped(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=32000)
+        _, quantity = Cart.objects.add_product(self.product.id, user_id=self.user.id, quantity=1000)
+        self.assertEqual(quantity, 32767)
+        _, quantity = Cart.objects.add_product(self.product.id, user_id=self.user.id, quantity=32767)
+        self.assertEqual(quantity, 32767)
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 32767)
+
+    def test_merge_is_capped(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=32000)
+        Cart.objects.create(session_key='guest-session', product=self.product, quantity=1000)
+        Cart.objects.merge_into_user(self.user.id, 'guest-session', {self.product.id: 32767})
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 32767)
+        self.assertFalse(Cart.objects.filter(session_key='guest-session').exists())
+
+
+class CartAddConcurrencyTest(TransactionTestCase):
+    threads = 16
+    adds_per_thread = 25
+
+    def setUp(self):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        self.product = Products.objects.create(name='Стол', slug='stol', price=100, category=category)
+        self.user = User.objects.create_user('buyer', password='x')
+
+    def add_in_parallel(self, **owner):
+        # потоки стартуют одновременно, у каждого свое соединение с БД
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                for _ in range(self.adds_per_thread):
+                    Cart.objects.add_product(self.product.id, **owner)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_adds_user(self):
+        self.add_in_parallel(user_id=self.user.id)
+        carts = Cart.objects.filter(user=self.user)
+        self.assertEqual(carts.count(), 1)
+        self.assertEqual(carts.get().quantity, self.threads * self.adds_per_thread)
+
+    def test_parallel_adds_session(self):
+        self.add_in_parallel(session_key='guest-session')
+        carts = Cart.objects.filter(session_key='guest-session')
+        self.assertEqual(carts.count(), 1)
+        self.assertEqual(carts.get().quantity, self.threads * self.adds_per_thread)
@@ -1,10 +1,126 @@
-from carts.models import Cart
+import json
+import time
 
+from django.conf import settings
+from django.core.cache import cache
 
-def get_user_carts(request):
+
+def cart_modified_key(user_id=None, session_key=None):
+    if user_id:
+        return f'cart_modified:user:{user_id}'
+    return f'cart_modified:session:{session_key}'
+
+
+def get_cart_modified(request):
     if request.user.is_authenticated:
-        return Cart.objects.filter(user=request.user).select_related('product')
+        key = cart_modified_key(user_id=request.user.id)
+    elif request.session.session_key:
+        key = cart_modified_key(session_key=request.session.session_key)
+    else:
+        # без сессии корзины еще нет
+        return 0
+    return cache.get_or_set(key, time.time, settings.SESSION_COOKIE_AGE)
+
+
+def touch_cart(user_id=None, session_key=None):
+    cache.set(cart_modified_key(user_id, session_key), time.time(), settings.SESSION_COOKIE_AGE)
+
+
+class CartSnapshot:
+    """
+    Корзина на время одного запроса: позиции, суммы по строкам и итоги считаются один раз.
+    В шаблонах ведет себя как список позиций. Создается хранилищем корзины (carts.backends).
+    """
+
+    def __init__(self, items, total_quantity, total_price):
+        self.items = items
+        self.total_quantity = total_quantity
+        self.total_price = total_price
+
+    @classmethod
+    def from_queryset(cls, carts):
+        # позиции, суммы по строкам и итоги одним запросом (CartQuerySet.with_totals)
+        items = list(carts.with_totals())
+        if not items:
+            return cls(items, 0, 0)
+        return cls(items, items[0].cart_total_quantity, items[0].cart_total_price)
+
+    @classmethod
+    def from_lines(cls, lines):
+        return cls(lines, sum(line.quantity for line in lines), sum(line.line_price for line in lines))
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+class InvalidCartOperation(Exception):
+    pass
+
+
+CART_OPERATIONS = ('add', 'set', 'remove')
+MAX_CART_OPERATIONS = 100
+MAX_CART_QUANTITY = 32767
+
+
+def parse_cart_quantity(value):
+    """Количество позиции корзины из запроса: целое от 1 до MAX_CART_QUANTITY, иначе InvalidCartOperation."""
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise InvalidCartOperation('Неверное количество')
+    if not 1 <= quantity <= MAX_CART_QUANTITY:
+        raise InvalidCartOperation('Неверное количество')
+    return quantity
+
+
+def parse_cart_operations(raw):
+    """
+    Разбирает JSON-список операций пакетного изменения корзины:
+    [{"op": "add" | "set" | "remove", "product_id" или "cart_id": id, "quantity": n}, ...].
+    Возвращает кортежи (op, 'product' | 'cart', id, quantity).
+    """
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        raise InvalidCartOperation('Неверный JSON')
+    if not isinstance(data, list) or not data:
+        raise InvalidCartOperation('Нужен непустой список операций')
+    if len(data) > MAX_CART_OPERATIONS:
+        raise InvalidCartOperation(f'Не больше {MAX_CART_OPERATIONS} операций за раз')
+
+    operations = []
+    for item in data:
+        if not isinstance(item, dict) or item.get('op') not in CART_OPERATIONS:
+            raise InvalidCartOperation('Неизвестная операция')
+        op = item['op']
+        kind = 'cart' if 'cart_id' in item else 'product'
+        try:
+            key = int(item[f'{kind}_id'])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCartOperation('Неверная операция')
+        quantity = parse_cart_quantity(item.get('quantity', 1)) if op != 'remove' else None
+        operations.append((op, kind, key, quantity))
+    return operations
+
 
-    if not request.session.session_key:
-        request.session.create()
-    return Cart.objects.filter(session_key=request.session.session_key).select_related('product')
+def fold_cart_operations(operations):
+    """
+    Сводит операции (op, product_id, quantity) по порядку к одному действию на товар:
+    ('add', n) - прибавить к тому, что есть, ('set', n) - установить, ('remove', None) - удалить.
+    """
+    actions = {}
+    for op, product_id, quantity in operations:
+        action, current = actions.get(product_id, ('add', 0))
+        if op == 'add' and action == 'remove':
+            actions[product_id] = ('set', quantity)
+        elif op == 'add':
+            actions[product_id] = (action, min(current + quantity, MAX_CART_QUANTITY))
+        else:
+            actions[product_id] = (op, quantity)
+    return actions
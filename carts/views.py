@@ -1,34 +1,26 @@
 from urllib import request
 
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.template.loader import render_to_string
 from django.views import View
 
+from carts.backends import get_cart_backend
 from carts.mixins import CartMixin
-from carts.utils import get_user_carts
+from carts.utils import InvalidCartOperation, parse_cart_operations
 from django.urls import reverse
 
-from carts.models import Cart
-from goods.models import Products
-
 
 class CartAddView(CartMixin, View):
     def post(self, request):
-        product_id = request.POST.get('product_id')
-        product = Products.objects.get(id=product_id)
-
-        cart = self.get_cart(request, product=product)
-        if cart:
-            cart.quantity += 1
-            cart.save()
-        else:
-            Cart.objects.create(user=request.user if request.user.is_authenticated else None,
-                                session_key=request.session_key if not request.user.is_authenticated else None,
-                                product=product, quantity=1)
+        try:
+            product_id = int(request.POST.get('product_id'))
+        except (TypeError, ValueError):
+            raise Http404()
+        cart_id = get_cart_backend(request).add(product_id)
 
         response_data = {
             'message': 'Товар добавлен в корзину',
-            'cart_items_html': self.render_cart(request)
+            **self.cart_response_data(request, cart_id)
         }
         return JsonResponse(response_data)
 
@@ -77,17 +69,19 @@ class CartAddView(CartMixin, View):
 
 class CartChangeView(CartMixin, View):
     def post(self, request):
-        cart_id = request.POST.get('cart_id')
-        cart = self.get_cart(request, cart_id=cart_id)
-
-        cart.quantity = request.POST.get('quantity')
-        cart.save()
-        quantity = cart.quantity
+        try:
+            cart_id = int(request.POST.get('cart_id'))
+        except (TypeError, ValueError):
+            raise Http404()
+        try:
+            quantity = get_cart_backend(request).change(cart_id, request.POST.get('quantity'))
+        except InvalidCartOperation as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
         response_data = {
             'message': 'Количество изменено',
             'quantity': quantity,
-            'cart_items_html': self.render_cart(request)
+            **self.cart_response_data(request, cart_id)
         }
         return JsonResponse(response_data)
 
@@ -124,16 +118,16 @@ class CartChangeView(CartMixin, View):
 
 class CartRemoveView(CartMixin, View):
     def post(self, request):
-        cart_id = request.POST.get('cart_id')
-
-        cart = self.get_cart(request, cart_id=cart_id)
-        quantity = cart.quantity
-        cart.delete()
+        try:
+            cart_id = int(request.POST.get('cart_id'))
+        except (TypeError, ValueError):
+            raise Http404()
+        quantity = get_cart_backend(request).remove(cart_id)
 
         response_data = {
             'messages': 'Товар удален',
             'quantity_deleted': quantity,
-            'cart_items_html': self.render_cart(request)
+            **self.cart_response_data(request, cart_id)
         }
         return JsonResponse(response_data)
 
@@ -164,3 +158,23 @@ class CartRemoveView(CartMixin, View):
 #     }
 #
 #     return JsonResponse(response_data)
+
+
+class CartBatchView(CartMixin, View):
+    """
+    Несколько изменений корзины одним запросом (например, быстрые клики +/-):
+    operations - JSON-список операций, см. carts.utils.parse_cart_operations.
+    """
+
+    def post(self, request):
+        try:
+            operations = parse_cart_operations(request.POST.get('operations'))
+        except InvalidCartOperation as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        product_ids = get_cart_backend(request).batch(operations)
+
+        response_data = {
+            'message': 'Корзина обновлена',
+            **self.cart_state_data(request, product_ids)
+        }
+        return JsonResponse(response_data)
@@ -5,3 +5,6 @@ class GoodsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goods'
     verbose_name = 'Товары'
+
+    def ready(self):
+        from goods import signals  # noqa: F401
@@ -0,0 +1,56 @@
+from bisect import bisect_left
+
+from goods.models import Products
+from goods.utils import PRODUCTS_VERSION_KEY, VersionedLocalCache
+
+
+class PrefixIndex:
+    """
+    Отсортированный список ключей "слово и все после него" в нижнем регистре.
+    Поиск по префиксу - bisect и проход по соседним ключам, без обращения к БД.
+    """
+
+    def __init__(self, products):
+        self.products = []
+        entries = []
+        for name, slug in products:
+            position = len(self.products)
+            self.products.append((name, slug))
+            words = name.lower().split()
+            # подсказка находится и по началу названия, и по началу любого слова в нем
+            for i in range(len(words)):
+                entries.append((' '.join(words[i:]), position))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.positions = [position for _, position in entries]
+
+    def __len__(self):
+        return len(self.products)
+
+    def search(self, prefix, limit=10):
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+
+        found = []
+        seen = set()
+        start = bisect_left(self.keys, prefix)
+        for i in range(start, len(self.keys)):
+            if not self.keys[i].startswith(prefix) or len(found) >= limit:
+                break
+            position = self.positions[i]
+            if position not in seen:
+                seen.add(position)
+                found.append(self.products[position])
+        return found
+
+
+def build_prefix_index():
+    return PrefixIndex(Products.objects.order_by().values_list('name', 'slug').iterator(chunk_size=5000))
+
+
+product_names = VersionedLocalCache(PRODUCTS_VERSION_KEY, build_prefix_index)
+
+
+def autocomplete(prefix, limit=10):
+    return product_names.get().search(prefix, limit)
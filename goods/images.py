@@ -0,0 +1,49 @@
+import hashlib
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# ширины для srcset; больше исходной ширины картинку не растягиваем
+IMAGE_WIDTHS = (320, 640, 1024)
+VARIANTS_DIR = 'goods_images/variants'
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+
+
+def make_variants(name, storage=default_storage):
+    """
+    Создает уменьшенные копии изображения: WebP и запасной JPEG (PNG для прозрачных) на каждую ширину.
+    В имени файла хэш содержимого, поэтому уже созданные копии повторно не пишутся.
+    Возвращает {'webp': [[ширина, имя], ...], 'fallback': [...]} для Products.image_variants.
+    """
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.md5(data).hexdigest()[:12]
+    stem = PurePosixPath(name).stem
+
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    formats = (('webp', 'webp', 'WEBP'), ('fallback', 'png', 'PNG') if has_alpha else ('fallback', 'jpg', 'JPEG'))
+    widths = sorted({width for width in IMAGE_WIDTHS if width < image.width} | {min(image.width, IMAGE_WIDTHS[-1])})
+
+    variants = {key: [] for key, _, _ in formats}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for key, extension, image_format in formats:
+            variant_name = f'{VARIANTS_DIR}/{stem}-{digest}-{width}.{extension}'
+            if not storage.exists(variant_name):
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **SAVE_OPTIONS[image_format])
+                variant_name = storage.save(variant_name, ContentFile(buffer.getvalue()))
+            variants[key].append([width, variant_name])
+    return variants
@@ -0,0 +1,45 @@
+import random
+import statistics
+import time
+
+from goods.models import Categories, Products
+
+WORDS = [
+    'стол', 'стул', 'диван', 'кровать', 'шкаф', 'комод', 'кресло', 'полка', 'тумба', 'столик',
+    'кухонный', 'офисный', 'угловой', 'прикроватный', 'чайный', 'двухспальный', 'мягкий', 'деревянный',
+    'белый', 'черный', 'дуб', 'сосна', 'металл', 'стекло', 'ткань', 'кожа', 'растение', 'цветок',
+]
+
+
+def seed_products(count, categories=10, batch_size=5000, seed=0):
+    """Создает count товаров со случайными названиями, описаниями, ценами и скидками."""
+    rnd = random.Random(seed)
+    category_objs = Categories.objects.bulk_create(
+        Categories(name=f'bench-category-{i}', slug=f'bench-category-{i}') for i in range(categories)
+    )
+
+    for start in range(0, count, batch_size):
+        Products.objects.bulk_create(
+            Products(
+                name=f'{" ".join(rnd.choices(WORDS, k=3))} {i}',
+                slug=f'bench-product-{i}',
+                description=' '.join(rnd.choices(WORDS, k=20)),
+                price=rnd.randint(100, 99999) / 100,
+                # по акции примерно каждый десятый товар
+                discount=rnd.choice([5, 10, 15, 25]) if rnd.random() < 0.1 else 0,
+                quantity=rnd.randint(0, 100),
+                category=rnd.choice(category_objs),
+            )
+            for i in range(start, min(start + batch_size, count))
+        )
+    return category_objs
+
+
+def timeit(func, repeat):
+    """Возвращает (медиана, минимум) времени вызова func в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), min(timings)
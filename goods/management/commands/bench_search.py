@@ -0,0 +1,59 @@
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from goods.management.commands._bench import seed_products, timeit
+from goods.models import Products
+from goods.utils import q_search, q_similar
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск по SearchVector, построенному на лету, и по сохраненному search_vector, '
+            'и замеряет запасной поиск по триграммам. '
+            'Тестовые товары создаются внутри транзакции, которая в конце откатывается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('queries', nargs='*',
+                            default=['стол', 'кухонный стол', 'кожаный диван', 'шкаф сосна', 'кухоный стл', 'кров'])
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f'Создаем {options["products"]} товаров...')
+            seed_products(options['products'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE product')
+
+            for text in options['queries']:
+                self.bench_query(text, options['repeat'])
+
+            transaction.set_rollback(True)
+
+    def bench_query(self, text, repeat):
+        query = SearchQuery(text)
+        inline = Products.objects.annotate(
+            rank=SearchRank(SearchVector('name', 'description'), query)
+        ).filter(rank__gt=0).order_by('-rank')
+        stored = q_search(text)
+        similar = q_similar(text)
+
+        # как в cached_search_ids: полный отсортированный список id, который потом кэшируется
+        inline_median, inline_min = timeit(lambda: list(inline.values_list('id', flat=True)), repeat)
+        stored_median, stored_min = timeit(lambda: list(stored.values_list('id', flat=True)), repeat)
+        similar_median, similar_min = timeit(lambda: list(similar.values_list('id', flat=True)), repeat)
+
+        self.stdout.write(
+            f'{text!r}: найдено {stored.count()} | '
+            f'на лету {inline_median:.1f} мс (мин. {inline_min:.1f}) | '
+            f'search_vector {stored_median:.1f} мс (мин. {stored_min:.1f}, '
+            f'{self.index_note(stored, "product_search_vector_idx")}) | '
+            f'триграммы {similar_median:.1f} мс (мин. {similar_min:.1f}, '
+            f'{self.index_note(similar, "product_name_trgm_idx")}), найдено {similar.count()}'
+        )
+
+    @staticmethod
+    def index_note(queryset, index_name):
+        # без индекса (нет pg_trgm, не применена миграция) замеры сравнивать бессмысленно
+        plan = queryset.values_list('id', flat=True).explain()
+        return f'индекс {index_name}' if index_name in plan else 'без индекса'
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from goods.management.commands._bench import seed_products
+from goods.models import Products
+from goods.paginators import KeysetPaginator
+from goods.utils import apply_catalog_filters
+from goods.views import CatalogView
+
+
+class Command(BaseCommand):
+    help = ('Заполняет каталог тестовыми товарами (в транзакции, которая откатывается) и проверяет через EXPLAIN, '
+            'что запросы CatalogView для всех фильтров и сортировок не используют Seq Scan по product')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            categories = seed_products(options['products'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE product')
+
+            failed = []
+            for name, sql, params in self.catalog_queries(categories[0].id):
+                plan = self.explain(sql, params)
+                seq_scan = 'Seq Scan on product' in plan
+                if seq_scan:
+                    failed.append(name)
+                self.stdout.write(f'{"SEQ SCAN" if seq_scan else "ok":8} {name}')
+                if options['verbose_plans'] or seq_scan:
+                    self.stdout.write(plan)
+
+            transaction.set_rollback(True)
+
+        if failed:
+            raise CommandError(f'Seq Scan в {len(failed)} запросах: {", ".join(failed)}')
+
+    def catalog_queries(self, category_id):
+        page_size = CatalogView.paginate_by
+        for category in ('all', category_id):
+            for on_sale in (None, 'on'):
+                for order_by in CatalogView.keyset_orderings:
+                    goods = Products.objects.all()
+                    if category != 'all':
+                        goods = goods.filter(category_id=category)
+                    goods = apply_catalog_filters(goods, on_sale, order_by)
+                    name = f'category={category} on_sale={on_sale} order_by={order_by}'
+
+                    # COUNT(*) по всему каталогу без фильтров всегда читает таблицу целиком,
+                    # поэтому дальние страницы листаются курсором
+                    if category != 'all' or on_sale:
+                        sql, params = goods.order_by().values('id').query.sql_with_params()
+                        yield f'{name} count', f'SELECT COUNT(*) FROM ({sql}) subquery', params
+
+                    yield f'{name} page 1', *goods[:page_size].query.sql_with_params()
+                    yield f'{name} page 50', *goods[page_size * 49:page_size * 50].query.sql_with_params()
+
+                    paginator = KeysetPaginator(goods, page_size, CatalogView.keyset_orderings[order_by])
+                    middle = goods[goods.count() // 2]
+                    for direction in ('n', 'p'):
+                        keyset = paginator.page_queryset(paginator.cursor_for(middle, direction))
+                        yield f'{name} cursor {direction}', *keyset.query.sql_with_params()
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
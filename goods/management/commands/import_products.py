@@ -0,0 +1,125 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from goods.models import Products
+from goods.utils import PRODUCTS_VERSION_KEY, bump_version, get_category_id, touch_all_products
+
+UPDATE_FIELDS = ['name', 'description', 'image', 'price', 'discount', 'quantity', 'category']
+
+
+def iter_json(file, chunk_size=64 * 1024):
+    """
+    Объекты из JSON-массива (как в fixtures/goods/products.json) или из JSON Lines,
+    читаются по кускам, весь файл в память не загружается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip('[,]').lstrip()
+        if buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield obj
+                buffer = buffer[end:]
+                continue
+        if eof:
+            return
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+class Command(BaseCommand):
+    help = ('Загружает товары из JSON/JSON Lines/CSV (поля как в fixtures/goods/products.json) пачками, '
+            'существующие товары с тем же slug обновляются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['json', 'csv'], help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'json')
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        total = 0
+        with open(path, encoding='utf-8', newline='') as f:
+            records = csv.DictReader(f) if file_format == 'csv' else iter_json(f)
+            batch = {}
+            for number, record in enumerate(records, start=1):
+                product = self.build_product(record.get('fields', record), number)
+                # два раза один slug в одном INSERT ... ON CONFLICT недопустимы, оставляем последнюю строку
+                batch[product.slug] = product
+                if len(batch) >= batch_size:
+                    total += self.save_batch(batch)
+                    self.report(total, started)
+                    batch = {}
+            if batch:
+                total += self.save_batch(batch)
+
+        # bulk_create сигналов не шлет: сбрасываем кэши списков и страниц товаров одним ключом
+        bump_version(PRODUCTS_VERSION_KEY)
+        touch_all_products()
+        self.report(total, started, style=self.style.SUCCESS)
+
+    def build_product(self, fields, number):
+        if not fields.get('slug'):
+            raise CommandError(f'Строка {number}: не указан slug')
+
+        category = fields.get('category')
+        if isinstance(category, int) or str(category).isdigit():
+            category_id = int(category)
+        else:
+            category_id = get_category_id(category)
+        if category_id is None:
+            raise CommandError(f'Строка {number}: неизвестная категория {category!r}')
+
+        try:
+            return Products(
+                name=fields['name'],
+                slug=fields['slug'],
+                description=fields.get('description') or '',
+                image=fields.get('image') or '',
+                price=Decimal(str(fields.get('price') or 0)),
+                discount=Decimal(str(fields.get('discount') or 0)),
+                quantity=int(fields.get('quantity') or 0),
+                category_id=category_id,
+            )
+        except (KeyError, ValueError, InvalidOperation) as e:
+            raise CommandError(f'Строка {number}: {e!r}')
+
+    def save_batch(self, batch):
+        products = list(batch.values())
+        with transaction.atomic():
+            saved_images = dict(Products.objects.filter(slug__in=batch).values_list('slug', 'image'))
+            # search_vector и счетчики product_facet обновят триггеры, sell_price посчитает сама БД
+            Products.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=UPDATE_FIELDS,
+            )
+            changed_images = [
+                slug for slug, image in saved_images.items() if image != batch[slug].image.name
+            ]
+            if changed_images:
+                # уменьшенные копии старой картинки больше не подходят (regenerate_image_variants)
+                Products.objects.filter(slug__in=changed_images).update(image_variants={})
+        return len(products)
+
+    def report(self, total, started, style=None):
+        elapsed = time.monotonic() - started
+        message = f'Загружено {total} товаров за {elapsed:.1f} с ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        self.stdout.write(style(message) if style else message)
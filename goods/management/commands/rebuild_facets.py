@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from goods.models import PRICE_BUCKETS, ProductFacet
+
+REBUILD_SQL = '''
+INSERT INTO product_facet (category_id, price_bucket, total, on_sale)
+SELECT category_id, width_bucket(sell_price, %s::numeric[]), count(*), count(*) FILTER (WHERE discount > 0)
+FROM product
+GROUP BY 1, 2
+'''
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики каталога (product_facet) по таблице product'
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # SHARE блокирует только запись в product, чтобы триггер не менял счетчики во время пересчета
+            cursor.execute('LOCK TABLE product IN SHARE MODE')
+            ProductFacet.objects.all().delete()
+            cursor.execute(REBUILD_SQL, [list(PRICE_BUCKETS)])
+
+        self.stdout.write(self.style.SUCCESS(f'Счетчики пересчитаны, строк: {ProductFacet.objects.count()}'))
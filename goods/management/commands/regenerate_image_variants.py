@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from goods.images import make_variants
+from goods.models import Products
+from goods.utils import PRODUCTS_VERSION_KEY, bump_version, touch_all_products
+
+
+def build_variants(item):
+    product_id, name = item
+    try:
+        return product_id, make_variants(name), None
+    except OSError as e:
+        return product_id, None, f'{name}: {e}'
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений товаров (goods.images.make_variants) в нескольких процессах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Пересоздать и уже заполненные варианты')
+
+    def handle(self, *args, **options):
+        products = Products.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            products = products.filter(image_variants={})
+        items = list(products.order_by('id').values_list('id', 'image'))
+        self.stdout.write(f'Изображений для обработки: {len(items)}')
+
+        # дочерние процессы не должны получить открытые соединения с БД
+        connections.close_all()
+        updated = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            for product_id, variants, error in executor.map(build_variants, items, chunksize=16):
+                if error:
+                    self.stderr.write(error)
+                    continue
+                updated.append(Products(id=product_id, image_variants=variants))
+
+        Products.objects.bulk_update(updated, ['image_variants'], batch_size=options['batch_size'])
+        # bulk_update сигналов не шлет, кэши страниц сбрасываем сами
+        bump_version(PRODUCTS_VERSION_KEY)
+        touch_all_products()
+        self.stdout.write(self.style.SUCCESS(f'Готово, обновлено товаров: {len(updated)}'))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Aggregate, Avg, Count, FloatField, Q
+from django.utils import timezone
+
+from goods.models import SearchQueryLog
+
+
+class Percentile(Aggregate):
+    function = 'percentile_cont'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+class Command(BaseCommand):
+    help = 'Самые медленные и самые частые поисковые запросы по данным SearchQueryLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--min-count', type=int, default=1,
+                            help='Не показывать в медленных запросы, которых было меньше')
+        parser.add_argument('--prune', action='store_true', help='Удалить записи старше --days')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        logs = SearchQueryLog.objects.filter(created_timestamp__gte=since)
+        if options['prune']:
+            deleted, _ = SearchQueryLog.objects.filter(created_timestamp__lt=since).delete()
+            self.stdout.write(f'Удалено старых записей: {deleted}')
+
+        summary = logs.aggregate(
+            total=Count('id'),
+            cached=Count('id', filter=Q(cached=True)),
+            empty=Count('id', filter=Q(results=0)),
+        )
+        if not summary['total']:
+            self.stdout.write('Поисковых запросов за период нет')
+            return
+        self.stdout.write(
+            f'Запросов за {options["days"]} дн.: {summary["total"]}, '
+            f'из кэша {summary["cached"] * 100 / summary["total"]:.0f}%, '
+            f'без результатов {summary["empty"] * 100 / summary["total"]:.0f}%'
+        )
+
+        stats = logs.values('query').annotate(
+            total=Count('id'),
+            p50=Percentile('duration', 0.5),
+            p95=Percentile('duration', 0.95),
+            # время без кэша - то, что стоит сам q_search
+            db_p95=Percentile('duration', 0.95, filter=Q(cached=False)),
+            empty=Count('id', filter=Q(results=0)),
+            avg_results=Avg('results'),
+        )
+        limit = options['limit']
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nСамые медленные (p95 без кэша):'))
+        slowest = stats.filter(total__gte=options['min_count'], db_p95__isnull=False).order_by('-db_p95')
+        self.write_rows(slowest[:limit])
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nСамые частые:'))
+        self.write_rows(stats.order_by('-total', 'query')[:limit])
+
+    def write_rows(self, rows):
+        self.stdout.write(
+            f'{"запрос":<40} {"кол-во":>7} {"p50, мс":>9} {"p95, мс":>9} {"p95 БД":>9} {"найдено":>8} {"пусто":>6}'
+        )
+        for row in rows:
+            db_p95 = f'{row["db_p95"]:9.1f}' if row['db_p95'] is not None else f'{"-":>9}'
+            self.stdout.write(
+                f'{row["query"][:40]:<40} {row["total"]:>7} {row["p50"]:9.1f} {row["p95"]:9.1f} {db_p95} '
+                f'{row["avg_results"]:8.1f} {row["empty"] * 100 / row["total"]:5.0f}%'
+            )
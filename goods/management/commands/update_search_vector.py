@@ -0,0 +1,36 @@
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand
+
+from goods.models import Products
+
+
+class Command(BaseCommand):
+    help = 'Заполняет product.search_vector для уже существующих товаров пачками по id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help='Пересчитать и уже заполненные строки')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Products.objects.all()
+        if not options['all']:
+            products = products.filter(search_vector__isnull=True)
+
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(
+                products.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            updated += Products.objects.filter(id__in=ids).update(
+                # тот же вектор, что строит триггер product_search_vector_trigger
+                search_vector=SearchVector('name', 'description')
+            )
+            last_id = ids[-1]
+            self.stdout.write(f'Обновлено {updated} товаров (до id={last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово, обновлено товаров: {updated}'))
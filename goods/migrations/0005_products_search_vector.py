@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:32
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Тот же текст, что строил SearchVector('name', 'description') в goods.utils.q_search
+SEARCH_VECTOR_TRIGGER_SQL = '''
+CREATE FUNCTION product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector(COALESCE(NEW.name, '') || ' ' || COALESCE(NEW.description, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON product
+    FOR EACH ROW EXECUTE FUNCTION product_search_vector_update();
+'''
+
+DROP_SEARCH_VECTOR_TRIGGER_SQL = '''
+DROP TRIGGER IF EXISTS product_search_vector_trigger ON product;
+DROP FUNCTION IF EXISTS product_search_vector_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0004_alter_products_options_alter_products_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER_SQL, DROP_SEARCH_VECTOR_TRIGGER_SQL),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:39
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0005_products_search_vector'),
+    ]
+
+    # STORED generated column: PostgreSQL вычисляет sell_price для всех существующих строк при ALTER TABLE
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='sell_price',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(models.F('price'), '-', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('price'), '*', models.F('discount')), '/', models.Value(100))), 2), output_field=models.DecimalField(decimal_places=2, max_digits=7), verbose_name='Цена со скидкой'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['sell_price', 'id'], name='product_sell_price_idx'),
+        ),
+    ]
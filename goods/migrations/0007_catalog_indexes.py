@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0006_products_sell_price'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='products',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='goods.categories', verbose_name='Категория'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'sell_price', 'id'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('discount__gt', 0)), fields=['id'], name='product_sale_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('discount__gt', 0)), fields=['sell_price', 'id'], name='product_sale_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('discount__gt', 0)), fields=['category', 'id'], name='product_sale_cat_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('discount__gt', 0)), fields=['category', 'sell_price', 'id'], name='product_sale_cat_price_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# пороги должны совпадать с goods.models.PRICE_BUCKETS
+FACET_TRIGGER_SQL = '''
+CREATE FUNCTION product_facet_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE product_facet
+        SET total = total - 1, on_sale = on_sale - (OLD.discount > 0)::int
+        WHERE category_id = OLD.category_id
+          AND price_bucket = width_bucket(OLD.sell_price, ARRAY[50, 100, 250, 500, 1000]::numeric[]);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO product_facet (category_id, price_bucket, total, on_sale)
+        VALUES (NEW.category_id, width_bucket(NEW.sell_price, ARRAY[50, 100, 250, 500, 1000]::numeric[]),
+                1, (NEW.discount > 0)::int)
+        ON CONFLICT (category_id, price_bucket) DO UPDATE
+        SET total = product_facet.total + 1, on_sale = product_facet.on_sale + EXCLUDED.on_sale;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER product_facet_insert_delete_trigger
+    AFTER INSERT OR DELETE ON product
+    FOR EACH ROW EXECUTE FUNCTION product_facet_update();
+
+CREATE TRIGGER product_facet_update_trigger
+    AFTER UPDATE OF category_id, price, discount ON product
+    FOR EACH ROW
+    WHEN ((OLD.category_id, width_bucket(OLD.sell_price, ARRAY[50, 100, 250, 500, 1000]::numeric[]), OLD.discount > 0)
+          IS DISTINCT FROM
+          (NEW.category_id, width_bucket(NEW.sell_price, ARRAY[50, 100, 250, 500, 1000]::numeric[]), NEW.discount > 0))
+    EXECUTE FUNCTION product_facet_update();
+
+INSERT INTO product_facet (category_id, price_bucket, total, on_sale)
+SELECT category_id, width_bucket(sell_price, ARRAY[50, 100, 250, 500, 1000]::numeric[]),
+       count(*), count(*) FILTER (WHERE discount > 0)
+FROM product
+GROUP BY 1, 2;
+'''
+
+DROP_FACET_TRIGGER_SQL = '''
+DROP TRIGGER IF EXISTS product_facet_update_trigger ON product;
+DROP TRIGGER IF EXISTS product_facet_insert_delete_trigger ON product;
+DROP FUNCTION IF EXISTS product_facet_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0007_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField(verbose_name='Ценовой диапазон')),
+                ('total', models.IntegerField(default=0, verbose_name='Товаров')),
+                ('on_sale', models.IntegerField(default=0, verbose_name='Товаров по акции')),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='goods.categories', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Счетчики каталога',
+                'verbose_name_plural': 'Счетчики каталога',
+                'db_table': 'product_facet',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productfacet',
+            constraint=models.UniqueConstraint(fields=('category', 'price_bucket'), name='product_facet_category_bucket'),
+        ),
+        migrations.RunSQL(FACET_TRIGGER_SQL, DROP_FACET_TRIGGER_SQL),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0009_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+    ]
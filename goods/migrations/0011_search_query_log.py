@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0010_products_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=200, verbose_name='Запрос')),
+                ('duration', models.FloatField(verbose_name='Время, мс')),
+                ('results', models.PositiveIntegerField(verbose_name='Найдено')),
+                ('cached', models.BooleanField(default=False, verbose_name='Из кэша')),
+                ('created_timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата запроса')),
+            ],
+            options={
+                'verbose_name': 'Поисковый запрос',
+                'verbose_name_plural': 'Поисковые запросы',
+                'db_table': 'search_query_log',
+                'indexes': [models.Index(fields=['created_timestamp'], name='search_query_log_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.http import Http404
+
+from goods.utils import CATALOG_ORDERINGS, apply_catalog_filters, cached_search_ids, get_category_id
+
+
+class CatalogFilterMixin:
+    """Фильтры каталога из адреса и GET-параметров (q, on_sale, order_by), общие для страницы и API."""
+    keyset_orderings = {
+        'default': ('id',),
+        **CATALOG_ORDERINGS,
+    }
+
+    def get_search_ids(self):
+        query = self.request.GET.get('q')
+        if not query or self.kwargs.get('category_slug') == 'all':
+            return None
+        return cached_search_ids(query, self.request.GET.get('on_sale'), self.request.GET.get('order_by'))
+
+    def filter_catalog(self, goods):
+        category_slug = self.kwargs.get('category_slug')
+        self.category_id = None
+        if category_slug != 'all':
+            self.category_id = get_category_id(category_slug)
+            if self.category_id is None:
+                raise Http404()
+            goods = goods.filter(category_id=self.category_id)
+
+        return apply_catalog_filters(goods, self.request.GET.get('on_sale'), self.request.GET.get('order_by'))
+
+    def get_keyset_ordering(self):
+        # результаты поиска листаются по закэшированному списку id, курсор им не нужен
+        if self.request.GET.get('q') and self.kwargs.get('category_slug') != 'all':
+            return None
+        order_by = self.request.GET.get('order_by') or 'default'
+        return self.keyset_orderings.get(order_by)
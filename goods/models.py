@@ -1,5 +1,10 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Round
 from django.urls import reverse
+from django.utils import timezone
 
 
 class Categories(models.Model):
@@ -15,21 +20,56 @@ class Categories(models.Model):
         return self.name
 
 
+class ProductsManager(models.Manager):
+    def get_queryset(self):
+        # search_vector нужен только в условиях поиска (q_search), в выборки товаров его не тянем
+        return super().get_queryset().defer('search_vector')
+
+
 class Products(models.Model):
     name = models.CharField(max_length=150, unique=True, verbose_name='Название')
     slug = models.SlugField(max_length=200, unique=True, blank=True, null=True, verbose_name='URL')
     description = models.TextField(blank=True, null=True, verbose_name='Описание')
     image = models.ImageField(upload_to='goods_images', blank=True, null=True, verbose_name='Изображение')
+    # уменьшенные копии image для srcset, заполняются при сохранении (goods.images.make_variants)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты изображения')
     price = models.DecimalField(default=0.00, max_digits=7, decimal_places=2, verbose_name='Цена')
     discount = models.DecimalField(default=0.00, max_digits=4, decimal_places=2, verbose_name='Скидка')
     quantity = models.PositiveIntegerField(default=0, verbose_name=' Количество')
-    category = models.ForeignKey(to=Categories, on_delete=models.CASCADE, verbose_name='Категория')
+    # отдельный индекс по category_id не нужен, его заменяет product_category_id_idx
+    category = models.ForeignKey(to=Categories, on_delete=models.CASCADE, db_index=False,
+                                 verbose_name='Категория')
+    # цена со скидкой, считается самой БД; после изменения цены актуальна только после refresh_from_db()
+    sell_price = models.GeneratedField(
+        expression=Round(F('price') - F('price') * F('discount') / 100, 2),
+        output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        db_persist=True,
+        verbose_name='Цена со скидкой',
+    )
+    # заполняется триггером product_search_vector_trigger (миграция 0005_products_search_vector)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         db_table = 'product'
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ('id',)
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            # для запасного нечеткого поиска q_similar (расширение pg_trgm)
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='product_name_trgm_idx'),
+            # индексы под фильтры и сортировки CatalogView (проверка: manage.py check_catalog_indexes)
+            models.Index(fields=['sell_price', 'id'], name='product_sell_price_idx'),
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+            models.Index(fields=['category', 'sell_price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['id'], condition=Q(discount__gt=0), name='product_sale_id_idx'),
+            models.Index(fields=['sell_price', 'id'], condition=Q(discount__gt=0), name='product_sale_price_idx'),
+            models.Index(fields=['category', 'id'], condition=Q(discount__gt=0), name='product_sale_cat_id_idx'),
+            models.Index(fields=['category', 'sell_price', 'id'], condition=Q(discount__gt=0),
+                         name='product_sale_cat_price_idx'),
+        ]
+
+    objects = ProductsManager()
 
     def __str__(self):
         return f'{self.name} Количество - {self.quantity}'
@@ -40,8 +80,53 @@ class Products(models.Model):
     def get_absolute_url(self):
         return reverse('catalog:product', kwargs={'product_slug': self.slug})
 
-    def sell_price(self):
-        if self.discount:
-            return round(self.price - self.price * self.discount / 100, 2)
 
-        return self.price
+# границы ценовых диапазонов для счетчиков каталога; те же числа зашиты в триггер product_facet_trigger
+PRICE_BUCKETS = (50, 100, 250, 500, 1000)
+
+
+class ProductFacet(models.Model):
+    """Счетчики товаров категории по ценовым диапазонам, поддерживаются триггером на product."""
+    category = models.ForeignKey(to=Categories, on_delete=models.CASCADE, db_index=False, verbose_name='Категория')
+    price_bucket = models.PositiveSmallIntegerField(verbose_name='Ценовой диапазон')
+    total = models.IntegerField(default=0, verbose_name='Товаров')
+    on_sale = models.IntegerField(default=0, verbose_name='Товаров по акции')
+
+    class Meta:
+        db_table = 'product_facet'
+        verbose_name = 'Счетчики каталога'
+        verbose_name_plural = 'Счетчики каталога'
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_bucket'], name='product_facet_category_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.category_id} | {self.bucket_label(self.price_bucket)} | {self.total}'
+
+    @staticmethod
+    def bucket_label(price_bucket):
+        if price_bucket == 0:
+            return f'до {PRICE_BUCKETS[0]} $'
+        if price_bucket == len(PRICE_BUCKETS):
+            return f'от {PRICE_BUCKETS[-1]} $'
+        return f'{PRICE_BUCKETS[price_bucket - 1]} - {PRICE_BUCKETS[price_bucket]} $'
+
+
+class SearchQueryLog(models.Model):
+    """Одна поисковая выдача; пишется пачками из goods.telemetry, читается командой search_report."""
+    query = models.CharField(max_length=200, verbose_name='Запрос')
+    duration = models.FloatField(verbose_name='Время, мс')
+    results = models.PositiveIntegerField(verbose_name='Найдено')
+    cached = models.BooleanField(default=False, verbose_name='Из кэша')
+    created_timestamp = models.DateTimeField(default=timezone.now, verbose_name='Дата запроса')
+
+    class Meta:
+        db_table = 'search_query_log'
+        verbose_name = 'Поисковый запрос'
+        verbose_name_plural = 'Поисковые запросы'
+        indexes = [
+            models.Index(fields=['created_timestamp'], name='search_query_log_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.query} | {self.duration:.1f} мс | {self.results}'
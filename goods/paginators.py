@@ -0,0 +1,145 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Keyset page of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по курсору: страница выбирается условием по ключу сортировки
+    (например, `(price, id)`), а не через OFFSET, поэтому COUNT(*) не нужен.
+    Последнее поле ключа должно быть уникальным (обычно `id`).
+    """
+
+    def __init__(self, object_list, per_page, ordering):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    @staticmethod
+    def encode_cursor(direction, values):
+        data = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(data)
+        except (binascii.Error, ValueError, TypeError):
+            raise InvalidCursor('Неверный курсор')
+        if direction not in ('n', 'p') or not isinstance(values, list):
+            raise InvalidCursor('Неверный курсор')
+        return direction, values
+
+    def key_values(self, obj):
+        # строки могут быть и моделями, и словарями из values()
+        if isinstance(obj, dict):
+            return [str(obj[field.lstrip('-')]) for field in self.ordering]
+        return [str(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+
+    def cursor_for(self, obj, direction):
+        return self.encode_cursor(direction, self.key_values(obj))
+
+    def _clean_values(self, values):
+        # значения из курсора приводим к типам полей сортировки: подделанный курсор - InvalidCursor, а не 500
+        if len(values) != len(self.ordering):
+            raise InvalidCursor('Неверный курсор')
+        cleaned = []
+        for field_name, value in zip(self.ordering, values):
+            field = self.object_list.model._meta.get_field(field_name.lstrip('-'))
+            # у GeneratedField (sell_price) тип задает output_field
+            field = getattr(field, 'output_field', None) or field
+            try:
+                if value is None:
+                    raise ValueError(value)
+                cleaned.append(field.to_python(value))
+            except (ValidationError, ValueError, TypeError):
+                raise InvalidCursor('Неверный курсор')
+        return cleaned
+
+    def _seek_filter(self, values, forward):
+        values = self._clean_values(values)
+        condition = Q()
+        bound = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            ascending = not field.startswith('-')
+            lookup = 'gt' if ascending == forward else 'lt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            if not equal and len(self.ordering) > 1:
+                # (a > x OR a = x AND b > y) индекс как диапазон не использует, добавляем a >= x
+                bound = Q(**{f'{name}__{lookup}e': value})
+            equal[name] = value
+        return bound & condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def page_queryset(self, cursor=None):
+        if cursor is None:
+            return self.object_list.order_by(*self.ordering)[:self.per_page + 1]
+
+        direction, values = self.decode_cursor(cursor)
+        forward = direction == 'n'
+
+        queryset = self.object_list.filter(self._seek_filter(values, forward))
+        queryset = queryset.order_by(*(self.ordering if forward else self._reversed_ordering()))
+        return queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        # без курсора - первая страница
+        forward = cursor is None or self.decode_cursor(cursor)[0] == 'n'
+        rows = list(self.page_queryset(cursor))
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows, self)
+
+        has_next = has_more if forward else True
+        has_previous = cursor is not None if forward else has_more
+        return KeysetPage(
+            rows,
+            self,
+            next_cursor=self.cursor_for(rows[-1], 'n') if has_next else None,
+            previous_cursor=self.cursor_for(rows[0], 'p') if has_previous else None,
+        )
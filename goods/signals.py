@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from goods.images import make_variants
+from goods.models import Categories, Products
+from goods.utils import CATEGORIES_VERSION_KEY, PRODUCTS_VERSION_KEY, bump_version, touch_product
+
+
+@receiver(pre_save, sender=Products)
+def remember_product_slug(sender, instance, **kwargs):
+    # страницу по старому адресу тоже нужно сбросить, если slug поменяли
+    if instance.pk:
+        saved = Products.objects.filter(pk=instance.pk).values_list('slug', 'image').first()
+        if saved:
+            instance.saved_slug, instance.saved_image = saved
+
+
+# версии меняем после коммита, иначе другой процесс может успеть перечитать еще старые данные
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def products_changed(sender, instance, **kwargs):
+    slugs = {instance.slug, getattr(instance, 'saved_slug', None)} - {None}
+
+    def on_commit():
+        bump_version(PRODUCTS_VERSION_KEY)
+        for slug in slugs:
+            touch_product(slug)
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_save, sender=Products)
+def update_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or (instance.image.name or '') == (getattr(instance, 'saved_image', None) or ''):
+        return
+    instance.image_variants = make_variants(instance.image.name) if instance.image else {}
+    Products.objects.filter(pk=instance.pk).update(image_variants=instance.image_variants)
+
+
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def categories_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(CATEGORIES_VERSION_KEY))
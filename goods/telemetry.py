@@ -0,0 +1,57 @@
+import atexit
+import threading
+import time
+
+from django.db import DatabaseError, transaction
+
+from goods.models import SearchQueryLog
+
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 30
+
+
+class SearchTelemetry:
+    """
+    Копит записи о поисковых запросах в памяти процесса и пишет их в SearchQueryLog
+    одним INSERT, когда набралось flush_size записей или прошло flush_interval секунд.
+    """
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, query, duration, results, cached):
+        entry = SearchQueryLog(query=query[:200], duration=duration, results=results, cached=cached)
+        with self._lock:
+            self._buffer.append(entry)
+            if len(self._buffer) < self.flush_size and time.monotonic() - self._flushed < self.flush_interval:
+                return
+            batch = self._take()
+        self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        self._write(batch)
+
+    def _take(self):
+        batch, self._buffer = self._buffer, []
+        self._flushed = time.monotonic()
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with transaction.atomic():
+                SearchQueryLog.objects.bulk_create(batch)
+        except DatabaseError:
+            # статистика не должна ломать поиск, пачка просто теряется
+            pass
+
+
+search_telemetry = SearchTelemetry()
+atexit.register(search_telemetry.flush)
@@ -1,6 +1,7 @@
 
 from django import template
-from goods.models import Categories
+from django.core.files.storage import default_storage
+from goods.utils import menu_categories
 
 from django.utils.http import urlencode
 
@@ -9,11 +10,18 @@ register = template.Library()
 
 @register.simple_tag()
 def tag_categories():
-    return Categories.objects.all()
+    return menu_categories.get()
 
 
 @register.simple_tag(takes_context=True)
 def change_params(context, **kwargs):
     query = context['request'].GET.dict()
     query.update(kwargs)
+    query = {key: value for key, value in query.items() if value is not None}
     return urlencode(query)
+
+
+@register.simple_tag()
+def image_srcset(product, image_format='fallback'):
+    variants = product.image_variants.get(image_format, [])
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in variants)
@@ -1,3 +1,154 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from goods.models import Categories, Products
+from goods.utils import VersionedLocalCache, cached_search_ids, get_product_modified, touch_product
+
+
+def reset_local_caches():
+    # значения в памяти процесса могли собраться в другом тесте по другим данным
+    cache.clear()
+    for local_cache in VersionedLocalCache.instances:
+        local_cache.expire()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CategoryPageQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Categories.objects.create(name='Столы', slug='stoly')
+        other = Categories.objects.create(name='Стулья', slug='stulya')
+        Products.objects.bulk_create(
+            Products(name=f'Стол {i}', slug=f'stol-{i}', price=100 + i, category=cls.category) for i in range(10)
+        )
+        Products.objects.create(name='Стул', slug='stul', price=50, category=other)
+
+    def setUp(self):
+        reset_local_caches()
+        self.url = reverse('catalog:index', kwargs={'category_slug': 'stoly'})
+        # карта slug -> id категории и меню загружаются один раз на процесс
+        self.client.get(self.url)
+
+    def test_category_page_queries(self):
+        # COUNT и страница товаров по category_id, плюс счетчики фасетов (product_facet)
+        with self.assertNumQueries(3) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product.slug for product in response.context['goods']], ['stol-0', 'stol-1', 'stol-2'])
+        self.assertEqual(response.context['page_obj'].paginator.count, 10)
+        listing = [query['sql'] for query in queries.captured_queries if 'FROM "product"' in query['sql']]
+        self.assertEqual(len(listing), 2)
+        for sql in listing:
+            self.assertNotIn('JOIN "category"', sql)
+
+    def test_unknown_category_without_queries(self):
+        # 404 по карте категорий, без EXISTS
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog:index', kwargs={'category_slug': 'net-takoj'}))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductModifiedTest(TestCase):
+    def setUp(self):
+        reset_local_caches()
+
+    def test_unknown_slug_not_cached(self):
+        response = self.client.get(reverse('catalog:product', kwargs={'product_slug': 'net-takogo'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(get_product_modified('net-takogo'))
+        self.assertIsNone(cache.get('product_modified:net-takogo'))
+
+    def test_touch_product(self):
+        touch_product('stol')
+        self.assertGreater(get_product_modified('stol'), 0)
+        self.assertIsNone(get_product_modified('stul'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        Products.objects.bulk_create([
+            Products(name='Стол', slug='stol', image='goods_images/stol.jpg', price=100, category=category),
+        ])
+
+    def setUp(self):
+        reset_local_caches()
+        touch_product('stol')
+        self.url = reverse('catalog:product', kwargs={'product_slug': 'stol'})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('ETag', response)
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_csrf_secret_changes_etag(self):
+        # после входа и выхода секрет другой: сохраненная копия страницы с прежним токеном не годится
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.client.cookies['csrftoken'] = 'a' * 32
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_evicted_mark_not_reused(self):
+        # файловый кэш мог вытеснить метку товара: прежние ETag и страница гостя не должны вернуться
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        modified = get_product_modified('stol')
+        cache.delete('product_modified:stol')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(get_product_modified('stol'), modified)
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_no_csrf_cookie_without_304(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        del self.client.cookies['csrftoken']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class CatalogIndexesTest(TestCase):
+    def test_catalog_queries_use_indexes(self):
+        # EXPLAIN каждой комбинации фильтров и сортировок CatalogView; на меньших таблицах
+        # планировщик законно предпочитает Seq Scan, поэтому товаров столько
+        out = StringIO()
+        call_command('check_catalog_indexes', products=20_000, stdout=out)
+        self.assertNotIn('SEQ SCAN', out.getvalue())
+        self.assertIn('order_by=-price cursor p', out.getvalue())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SearchFallbackTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.table, cls.coffee_table = Products.objects.bulk_create([
+            Products(name='Стол дубовый', slug='stol', price=100, category=category),
+            Products(name='Столик журнальный', slug='stolik', price=50, discount=10, category=category),
+        ])
+
+    def setUp(self):
+        reset_local_caches()
+
+    def test_typo_falls_back_to_trigrams(self):
+        self.assertEqual(cached_search_ids('журнальнй'), [self.coffee_table.id])
+        self.assertEqual(cached_search_ids('журнальнй', on_sale='on'), [self.coffee_table.id])
+
+    def test_filtered_out_matches_without_fallback(self):
+        # 'стол' находится FTS, просто не по акции: похожий по названию 'Столик' подставлять нельзя
+        self.assertEqual(cached_search_ids('стол'), [self.table.id])
+        self.assertEqual(cached_search_ids('стол', on_sale='on'), [])
@@ -6,6 +6,10 @@ app_name = 'goods'
 
 urlpatterns = [
     path('search/', views.CatalogView.as_view(), name='search'),
+    path('autocomplete/', views.AutocompleteView.as_view(), name='autocomplete'),
+    path('api/search/', views.CatalogApiView.as_view(), name='api_search'),
+    path('api/product/<slug:product_slug>/', views.ProductApiView.as_view(), name='api_product'),
+    path('api/<slug:category_slug>/', views.CatalogApiView.as_view(), name='api_index'),
     path('<slug:category_slug>/', views.CatalogView.as_view(), name='index'),
     path('product/<slug:product_slug>/', views.ProductView.as_view(), name='product'),
 ]
@@ -1,39 +1,276 @@
-from goods.models import Products
-from django.db.models import Q
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank, SearchHeadline
+import hashlib
+import threading
+import time
+
+from goods.models import Categories, ProductFacet, Products
+from goods.telemetry import search_telemetry
+from django.core.cache import cache
+from django.db.models import F, Q, Sum
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchHeadline, TrigramWordSimilarity
+
+PRODUCTS_VERSION_KEY = 'products_version'
+CATEGORIES_VERSION_KEY = 'categories_version'
+PRODUCTS_TOUCHED_KEY = 'products_touched'
+# остатки меняет каждый заказ, поэтому их версия отдельно от PRODUCTS_VERSION_KEY (поиск, автодополнение)
+STOCK_VERSION_KEY = 'stock_version'
+PRODUCT_MODIFIED_TIMEOUT = 60 * 60 * 24 * 30
+SEARCH_CACHE_TIME = 60 * 15
+# значения order_by из GET -> сортировка; сортируем по цене со скидкой,
+# id в том же направлении, чтобы обе сортировки шли по одному индексу (sell_price, id)
+CATALOG_ORDERINGS = {
+    'price': ('sell_price', 'id'),
+    '-price': ('-sell_price', '-id'),
+}
+
+
+# версия - время в наносекундах, а не счетчик: если файловый кэш вытеснит ключ при чистке,
+# новая версия не совпадет ни с одной прежней и старые ключи поиска и ETag не оживут
+def get_version(version_key):
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_version(version_key):
+    cache.set(version_key, time.time_ns(), None)
+    # в этом процессе новую версию видно сразу, не дожидаясь check_interval
+    for local_cache in VersionedLocalCache.instances:
+        if local_cache.version_key == version_key:
+            local_cache.expire()
+
+
+def get_product_modified(slug):
+    """
+    Время изменения товара; массовые загрузки сдвигают общую отметку PRODUCTS_TOUCHED_KEY.
+    None, если метки товара нет в кэше (не было или ее вытеснили): прежнее значение возвращать нельзя,
+    с ним совпали бы ETag и ключ страницы товара до правки. Метку ставит mark_product_modified.
+    """
+    key = f'product_modified:{slug}'
+    values = cache.get_many([key, PRODUCTS_TOUCHED_KEY])
+    if key not in values:
+        return None
+    if PRODUCTS_TOUCHED_KEY not in values:
+        # общую отметку тоже могли вытеснить: новое время больше любого прежнего
+        cache.add(PRODUCTS_TOUCHED_KEY, time.time(), None)
+        values[PRODUCTS_TOUCHED_KEY] = cache.get(PRODUCTS_TOUCHED_KEY, 0)
+    return max(values.values())
+
+
+def mark_product_modified(slug):
+    # вызывать, только когда товар точно есть в БД: для выдуманных slug записей в кэше не создаем
+    cache.add(f'product_modified:{slug}', time.time(), PRODUCT_MODIFIED_TIMEOUT)
+    return get_product_modified(slug) or time.time()
+
+
+def touch_product(slug):
+    cache.set(f'product_modified:{slug}', time.time(), PRODUCT_MODIFIED_TIMEOUT)
+
+
+def touch_all_products():
+    cache.set(PRODUCTS_TOUCHED_KEY, time.time(), None)
+
+
+class VersionedLocalCache:
+    """
+    Значение в памяти процесса, которое пересобирается функцией build,
+    как только в общем кэше меняется версия version_key.
+    С check_interval версия в общем кэше проверяется не чаще раза в столько секунд.
+    """
+    instances = []
+
+    def __init__(self, version_key, build, check_interval=0):
+        self.version_key = version_key
+        self.build = build
+        self.check_interval = check_interval
+        self._version = None
+        self._value = None
+        self._checked = None
+        self._lock = threading.Lock()
+        VersionedLocalCache.instances.append(self)
+
+    def get(self):
+        checked = self._checked
+        if checked is not None and time.monotonic() - checked < self.check_interval:
+            return self._value
+
+        version = get_version(self.version_key)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._value = self.build()
+                    self._version = version
+        self._checked = time.monotonic()
+        return self._value
+
+    def expire(self):
+        self._checked = None
+
+
+category_ids = VersionedLocalCache(
+    CATEGORIES_VERSION_KEY,
+    lambda: dict(Categories.objects.values_list('slug', 'id')),
+    check_interval=2,
+)
+
+# меню категорий в base.html, выводится на каждой странице
+menu_categories = VersionedLocalCache(
+    CATEGORIES_VERSION_KEY,
+    lambda: list(Categories.objects.order_by('id')),
+    check_interval=2,
+)
+
+
+def get_category_id(slug):
+    return category_ids.get().get(slug)
+
+
+def apply_catalog_filters(goods, on_sale=None, order_by=None):
+    if on_sale:
+        goods = goods.filter(discount__gt=0)
+
+    if order_by and order_by != 'default':
+        goods = goods.order_by(*CATALOG_ORDERINGS.get(order_by, (order_by,)))
+
+    return goods
+
+
+def is_id_query(query):
+    return query.isdigit() and len(query) <= 5
 
 
 def q_search(query):
-    if query.isdigit() and len(query) <= 5:
+    if is_id_query(query):
         return Products.objects.filter(id=int(query))
 
-    vector = SearchVector('name', 'description')
     query = SearchQuery(query)
 
-    result = Products.objects.annotate(rank=SearchRank(vector, query)).filter(rank__gt=0).order_by('-rank')
-    result = result.annotate(
+    return Products.objects.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank')
+    # keywords = [word for word in query.split() if len(word) > 2]
+    #
+    # q_objects = Q()
+    #
+    # for token in keywords:
+    #     q_objects |= Q(description__icontains=token)
+    #     q_objects |= Q(name__icontains=token)
+    #
+    # return Products.objects.filter(q_objects)
+
+
+def q_similar(query):
+    """
+    Запасной нечеткий поиск по названию (опечатки, части слов), когда q_search ничего не нашел.
+    Оператор %> (trigram_word_similar) использует индекс product_name_trgm_idx.
+    """
+    return Products.objects.filter(name__trigram_word_similar=query).annotate(
+        similarity=TrigramWordSimilarity(query, 'name')
+    ).order_by('-similarity')
+
+
+def get_facets(category_id=None):
+    """Счетчики для боковой панели каталога: товары по акции и по ценовым диапазонам."""
+    facets = ProductFacet.objects.all()
+    if category_id:
+        facets = facets.filter(category_id=category_id)
+    rows = facets.values('price_bucket').annotate(
+        products=Sum('total'), products_on_sale=Sum('on_sale')
+    ).filter(products__gt=0).order_by('price_bucket')
+
+    return {
+        'on_sale': sum(row['products_on_sale'] for row in rows),
+        'price_ranges': [
+            {'label': ProductFacet.bucket_label(row['price_bucket']), 'count': row['products']} for row in rows
+        ],
+    }
+
+
+def normalize_query(query):
+    # plainto_tsquery соединяет слова через &, поэтому регистр и порядок слов на результат не влияют
+    return ' '.join(sorted(query.lower().split()))
+
+
+def cached_search_ids(query, on_sale=None, order_by=None):
+    """
+    Отсортированный список id найденных товаров. Кэшируется по нормализованному запросу
+    и фильтрам; при изменении любого товара версия меняется и старые записи не используются.
+    """
+    started = time.perf_counter()
+    query = normalize_query(query)
+    params = f'{query}|{bool(on_sale)}|{order_by or "default"}'
+    cache_name = f'search:{get_version(PRODUCTS_VERSION_KEY)}:{hashlib.md5(params.encode()).hexdigest()}'
+
+    ids = cache.get(cache_name)
+    cached = ids is not None
+    if not cached:
+        goods = apply_catalog_filters(q_search(query), on_sale, order_by)
+        ids = list(goods.values_list('id', flat=True))
+        # нечеткий поиск - только если FTS не нашел ничего и без фильтров: иначе при on_sale вместо
+        # точных совпадений без скидки показались бы посторонние товары с похожими названиями
+        if not ids and not is_id_query(query) and not (on_sale and q_search(query).exists()):
+            goods = apply_catalog_filters(q_similar(query), on_sale, order_by)
+            ids = list(goods.values_list('id', flat=True))
+        cache.set(cache_name, ids, SEARCH_CACHE_TIME)
+
+    search_telemetry.record(query, (time.perf_counter() - started) * 1000, len(ids), cached)
+    return ids
+
+
+class ProductIdList:
+    """
+    Товары по готовому списку id. Пагинатор берет длину списка без COUNT(*),
+    а из БД загружаются только товары запрошенного среза.
+    С fields срез возвращает словари values() вместо моделей.
+    """
+
+    def __init__(self, ids, fields=None):
+        self.ids = ids
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return Products.objects.get(id=self.ids[index])
+
+        ids = self.ids[index]
+        if self.fields:
+            rows = Products.objects.filter(id__in=ids).values('id', *self.fields)
+            products = {row['id']: row for row in rows}
+        else:
+            products = Products.objects.in_bulk(ids)
+        return [products[product_id] for product_id in ids if product_id in products]
+
+
+def q_headlines(products, query):
+    """
+    Подсветка найденных слов (headline/bodyline) только для переданных товаров,
+    обычно это товары текущей страницы поиска.
+    """
+    products = list(products)
+    if not products or is_id_query(query):
+        return products
+
+    query = SearchQuery(query)
+    highlights = Products.objects.filter(id__in=[product.id for product in products]).annotate(
         headline=SearchHeadline(
             'name',
             query,
             start_sel='<span style="background-color: yellow;">',
             stop_sel='</span>',
-        )
-    )
-    result = result.annotate(
+        ),
         bodyline=SearchHeadline(
             'description',
             query,
             start_sel='<span style="background-color: yellow;">',
             stop_sel='</span>',
-        )
-    )
-    return result
-    # keywords = [word for word in query.split() if len(word) > 2]
-    #
-    # q_objects = Q()
-    #
-    # for token in keywords:
-    #     q_objects |= Q(description__icontains=token)
-    #     q_objects |= Q(name__icontains=token)
-    #
-    # return Products.objects.filter(q_objects)
+        ),
+    ).values_list('id', 'headline', 'bodyline')
+    highlights = {product_id: (headline, bodyline) for product_id, headline, bodyline in highlights}
+
+    for product in products:
+        product.headline, product.bodyline = highlights[product.id]
+    return products
@@ -1,45 +1,85 @@
-from django.core.paginator import Paginator
-from django.http import Http404
+import hashlib
+from datetime import datetime, timezone
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from django.views import View
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import DetailView, ListView
 
+from carts.utils import get_cart_modified
+from goods.autocomplete import autocomplete
+from goods.mixins import CatalogFilterMixin
 from goods.models import Products
-from goods.utils import q_search
+from goods.paginators import InvalidCursor, KeysetPaginator
+from goods.utils import (
+    CATEGORIES_VERSION_KEY, PRODUCTS_VERSION_KEY, STOCK_VERSION_KEY, ProductIdList, get_facets, get_product_modified,
+    get_version, mark_product_modified, q_headlines,
+)
 
 
-class CatalogView(ListView):
+class CatalogView(CatalogFilterMixin, ListView):
     model = Products
     template_name = 'goods/catalog.html'
     context_object_name = 'goods'
     paginate_by = 3
-    allow_empty = False
+    # пустой список все равно дает 404, но через пагинатор (см. get_paginator), без отдельного EXISTS
+    allow_empty = True
 
     def get_queryset(self):
-        category_slug = self.kwargs.get('category_slug')
-        on_sale = self.request.GET.get('on_sale')
-        order_by = self.request.GET.get('order_by')
-        query = self.request.GET.get('q')
-
-        if category_slug == 'all':
-            goods = super().get_queryset()
-        elif query:
-            goods = q_search(query)
-        else:
-            goods = super().get_queryset().filter(category__slug=category_slug)
-            if not goods.exists():
-                raise Http404()
+        self.search_ids = self.get_search_ids()
+        if self.search_ids is not None:
+            self.category_id = None
+            return ProductIdList(self.search_ids)
+        return self.filter_catalog(super().get_queryset())
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return super().get_paginator(queryset, per_page, orphans, allow_empty_first_page=False, **kwargs)
 
-        if on_sale:
-            goods = goods.filter(discount__gt=0)
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        cursor = self.request.GET.get('cursor')
 
-        if order_by and order_by != 'default':
-            goods = goods.order_by(order_by)
+        if not ordering:
+            return super().paginate_queryset(queryset, page_size)
 
-        return goods
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        if not cursor:
+            page_paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            # переходы "Назад"/"Следующая" идут по курсору, номера страниц остаются для первых страниц
+            rows = page.object_list = list(object_list)
+            page.next_cursor = paginator.cursor_for(rows[-1], 'n') if page.has_next() else None
+            page.previous_cursor = paginator.cursor_for(rows[0], 'p') if page.has_previous() else None
+            return page_paginator, page, rows, is_paginated
+
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        if not page.object_list:
+            raise Http404('Страница пуста')
+        return paginator, page, page.object_list, True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'HOME - Каталог'
         context['slug_url'] = self.kwargs.get('category_slug')
+
+        # на /catalog/all/ параметр q поиска не включает, это обычный список с фасетами
+        if self.search_ids is not None:
+            context['goods'] = q_headlines(context['goods'], self.request.GET.get('q'))
+        else:
+            context['facets'] = get_facets(self.category_id)
         return context
 
 
@@ -75,15 +115,216 @@ class CatalogView(ListView):
 #     return render(request, 'goods/catalog.html', context)
 
 
+class AutocompleteView(View):
+    max_limit = 20
+
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get('limit', 10)), self.max_limit)
+        except ValueError:
+            limit = 10
+
+        results = [
+            {'name': name, 'slug': slug, 'url': reverse('catalog:product', kwargs={'product_slug': slug})}
+            for name, slug in autocomplete(request.GET.get('q', ''), limit)
+        ]
+        return JsonResponse({'results': results})
+
+
+API_CACHE_TIME = 60
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def catalog_api_etag(request, **kwargs):
+    # ответ зависит только от адреса и данных каталога, пользователь и сессия не используются
+    parts = (request.get_full_path(), get_version(PRODUCTS_VERSION_KEY), get_version(CATEGORIES_VERSION_KEY))
+    if 'quantity' in request.GET.get('fields', '').split(','):
+        parts += (get_version(STOCK_VERSION_KEY),)
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def product_api_etag(request, product_slug):
+    modified = get_product_modified(product_slug)
+    if modified is None:
+        return None
+    parts = (request.get_full_path(), modified)
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class ProductsApiView(View):
+    """Товары в JSON: из БД читаются только запрошенные в ?fields= поля, модели не создаются."""
+    allowed_fields = (
+        'id', 'name', 'slug', 'description', 'image', 'price', 'discount', 'sell_price', 'quantity', 'category_id',
+    )
+    default_fields = ('id', 'name', 'slug', 'image', 'price', 'discount', 'sell_price')
+
+    def get_fields(self):
+        fields = self.request.GET.get('fields')
+        if not fields:
+            return list(self.default_fields)
+        fields = list(dict.fromkeys(fields.split(',')))
+        unknown = set(fields) - set(self.allowed_fields)
+        if unknown:
+            raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+        return fields
+
+    def serialize(self, row, fields):
+        data = {field: row[field] for field in fields}
+        if data.get('image'):
+            data['image'] = default_storage.url(data['image'])
+        return data
+
+
+@method_decorator(cache_control(public=True, max_age=API_CACHE_TIME), name='get')
+@method_decorator(condition(etag_func=catalog_api_etag), name='get')
+class CatalogApiView(CatalogFilterMixin, ProductsApiView):
+    paginate_by = 20
+    max_paginate_by = 100
+
+    def get(self, request, category_slug=None):
+        try:
+            fields = self.get_fields()
+            limit = min(int(request.GET.get('limit', self.paginate_by)), self.max_paginate_by)
+        except ValueError as e:
+            return json_response({'error': str(e)}, status=400)
+
+        ordering = self.keyset_orderings.get(request.GET.get('order_by') or 'default')
+        if ordering is None:
+            return json_response({'error': 'Неизвестная сортировка'}, status=400)
+
+        search_ids = self.get_search_ids()
+        if search_ids is not None:
+            # результаты поиска уже лежат в кэше списком id, листаем их по номеру страницы
+            try:
+                page = Paginator(ProductIdList(search_ids, fields), max(limit, 1)).page(request.GET.get('page', 1))
+            except InvalidPage as e:
+                raise Http404(str(e))
+            rows = page.object_list
+            next_url = self.page_url(page=page.next_page_number()) if page.has_next() else None
+            previous_url = self.page_url(page=page.previous_page_number()) if page.has_previous() else None
+        else:
+            goods = self.filter_catalog(Products.objects.all())
+            projection = dict.fromkeys([*fields, *(field.lstrip('-') for field in ordering)])
+            paginator = KeysetPaginator(goods.values(*projection), max(limit, 1), ordering)
+            try:
+                page = paginator.page(request.GET.get('cursor'))
+            except InvalidCursor as e:
+                return json_response({'error': str(e)}, status=400)
+            rows = page.object_list
+            next_url = self.page_url(cursor=page.next_cursor) if page.has_next() else None
+            previous_url = self.page_url(cursor=page.previous_cursor) if page.has_previous() else None
+
+        return json_response({
+            'results': [self.serialize(row, fields) for row in rows],
+            'next': next_url,
+            'previous': previous_url,
+        })
+
+    def page_url(self, **params):
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        query.pop('cursor', None)
+        query.update(params)
+        return f'{self.request.path}?{query.urlencode()}'
+
+
+@method_decorator(cache_control(public=True, max_age=API_CACHE_TIME), name='get')
+@method_decorator(condition(etag_func=product_api_etag), name='get')
+class ProductApiView(ProductsApiView):
+    def get(self, request, product_slug):
+        try:
+            fields = self.get_fields()
+        except ValueError as e:
+            return json_response({'error': str(e)}, status=400)
+
+        row = Products.objects.filter(slug=product_slug).values(*fields).first()
+        if row is None:
+            raise Http404()
+        mark_product_modified(product_slug)
+        return json_response(self.serialize(row, fields))
+
+
+PRODUCT_PAGE_CACHE_TIME = 60 * 10
+CSRF_TOKEN_MARKER = 'csrftokenmarker0csrftokenmarker0'
+CART_BUTTON_MARKER = '<!-- cart-button -->'
+
+
+def has_pending_messages(request):
+    # страницу с уведомлением нельзя ни кэшировать, ни отдавать как 304 - уведомление потеряется
+    return any(True for _ in messages.get_messages(request))
+
+
+def skip_conditional_get(request):
+    # без cookie csrftoken страница выдаст новый секрет, а в сохраненной у браузера копии токен от старого
+    return has_pending_messages(request) or not request.META.get('CSRF_COOKIE')
+
+
+def product_etag(request, product_slug):
+    modified = get_product_modified(product_slug)
+    if modified is None or skip_conditional_get(request):
+        return None
+    # страница зависит от товара, меню категорий, корзины пользователя и csrf-токена в форме:
+    # auth.login() меняет секрет, и копия страницы со старым токеном отдавала бы 403 на отправку формы
+    parts = (
+        modified,
+        get_version(CATEGORIES_VERSION_KEY),
+        get_cart_modified(request),
+        request.user.pk or 'anon',
+        request.META['CSRF_COOKIE'],
+    )
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def product_last_modified(request, product_slug):
+    modified = get_product_modified(product_slug)
+    if modified is None or skip_conditional_get(request):
+        return None
+    return datetime.fromtimestamp(max(modified, get_cart_modified(request)), tz=timezone.utc)
+
+
+@method_decorator(condition(etag_func=product_etag, last_modified_func=product_last_modified), name='get')
 class ProductView(DetailView):
     template_name = 'goods/product.html'
     slug_url_kwarg = 'product_slug'
     context_object_name = 'product'
 
     def get_object(self, queryset=None):
-        product = Products.objects.get(slug=self.kwargs.get(self.slug_url_kwarg))
+        product = get_object_or_404(Products, slug=self.kwargs.get(self.slug_url_kwarg))
+        # без метки изменения ETag не считается; товар найден, ставим ее для следующих запросов
+        self.modified = mark_product_modified(product.slug)
         return product
 
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated or has_pending_messages(request):
+            return super().get(request, *args, **kwargs)
+
+        # для гостей страница общая: кэшируем ее с метками вместо csrf-токена и кнопки корзины
+        slug = kwargs[self.slug_url_kwarg]
+        self.object = None
+        modified = get_product_modified(slug)
+        if modified is None:
+            self.object = self.get_object()
+            modified = self.modified
+        versions = f'{slug}:{modified}:{get_version(CATEGORIES_VERSION_KEY)}'
+        cache_name = f'product_page:{hashlib.md5(versions.encode()).hexdigest()}'
+        page = cache.get(cache_name)
+        if page is None:
+            self.object = self.object or self.get_object()
+            context = self.get_context_data(
+                object=self.object,
+                csrf_token=CSRF_TOKEN_MARKER,
+                cart_placeholder=mark_safe(CART_BUTTON_MARKER),
+            )
+            page = render_to_string(self.template_name, context, request=request)
+            cache.set(cache_name, page, PRODUCT_PAGE_CACHE_TIME)
+
+        page = page.replace(CSRF_TOKEN_MARKER, get_token(request))
+        page = page.replace(CART_BUTTON_MARKER, render_to_string('includes/cart_button.html', request=request))
+        return HttpResponse(page)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = self.object.name
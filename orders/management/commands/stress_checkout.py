@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from carts.models import Cart
+from goods.management.commands._bench import seed_products
+from goods.models import Categories, Products
+from orders.models import Order, OrderItem
+from orders.utils import CheckoutError, place_order
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочная проверка оформления заказа: много пользователей одновременно покупают одни и те же '
+            'товары с маленьким остатком. Проверяет, что товара не продано больше, чем было, и что нет '
+            'взаимных блокировок. Тестовые данные записываются в БД (потокам нужны закоммиченные строки) '
+            'и в конце удаляются. Необязательный большой прогон: та же проверка в малом масштабе '
+            'выполняется в тестах (orders.tests.ConcurrentCheckoutTest)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--threads', type=int, default=32, help='Не больше, чем разрешает max_connections')
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--stock', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        categories = seed_products(options['products'], categories=1, seed=options['seed'])
+        products = list(Products.objects.filter(category__in=categories).order_by('id'))
+        Products.objects.filter(id__in=[product.id for product in products]).update(quantity=options['stock'])
+        users = [User.objects.create_user(f'stress-checkout-{i}') for i in range(options['users'])]
+        try:
+            for user in users:
+                # разный набор и порядок товаров у каждого: блокировки все равно берутся по id
+                Cart.objects.bulk_create(
+                    Cart(user=user, product=product, quantity=rnd.randint(1, 3))
+                    for product in rnd.sample(products, rnd.randint(1, len(products)))
+                )
+            results = self.run_checkouts(users, min(options['threads'], len(users)))
+            self.verify(products, users, options['stock'], results)
+        finally:
+            Order.objects.filter(user__in=users).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            Products.objects.filter(category__in=categories).delete()
+            Categories.objects.filter(id__in=[category.id for category in categories]).delete()
+
+    def run_checkouts(self, users, thread_count):
+        results = Counter()
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(thread_count)
+
+        def checkout(thread_users):
+            barrier.wait()
+            try:
+                for user in thread_users:
+                    try:
+                        place_order(user, phone_number='0000000000')
+                        outcome = 'placed'
+                    except CheckoutError:
+                        outcome = 'out_of_stock'
+                    except Exception as e:
+                        outcome = 'error'
+                        errors.append(repr(e))
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=checkout, args=(users[i::thread_count],)) for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f'Заказов оформлено: {results["placed"]}, отказано (нет на складе): '
+                          f'{results["out_of_stock"]}, за {elapsed:.1f} с')
+        if errors:
+            raise CommandError(f'Ошибки при оформлении ({len(errors)}): {errors[:5]}')
+        return results
+
+    def verify(self, products, users, stock, results):
+        sold = dict(OrderItem.objects.filter(order__user__in=users).values_list('product')
+                    .annotate(total=Sum('quantity')))
+        left = dict(Products.objects.filter(id__in=[product.id for product in products])
+                    .values_list('id', 'quantity'))
+        for product in products:
+            if left[product.id] < 0 or left[product.id] + sold.get(product.id, 0) != stock:
+                raise CommandError(f'Товар {product.id}: было {stock}, продано {sold.get(product.id, 0)}, '
+                                   f'осталось {left[product.id]}')
+
+        carts_left = Cart.objects.filter(user__in=users).values('user').distinct().count()
+        if Order.objects.filter(user__in=users).count() != results['placed'] or carts_left != results['out_of_stock']:
+            raise CommandError('Число заказов или оставшихся корзин не совпадает с результатами')
+        self.stdout.write(self.style.SUCCESS(
+            f'Лишнего не продано: продано {sum(sold.values())} шт., остаток {sum(left.values())} шт., '
+            'взаимных блокировок нет'
+        ))
@@ -1,3 +1,157 @@
-from django.test import TestCase
+import random
+import threading
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from carts.models import Cart
+from goods.models import Categories, Products
+from goods.utils import PRODUCTS_VERSION_KEY, VersionedLocalCache, get_product_modified, get_version
+from orders.models import Order, OrderItem
+from orders.utils import CheckoutError, place_order
+from users.models import User
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlaceOrderCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        cls.user = User.objects.create_user('buyer', password='x')
+        cls.product, = Products.objects.bulk_create([
+            Products(name='Стол', slug='stol', price=100, quantity=10, category=category),
+        ])
+        Cart.objects.create(user=cls.user, product=cls.product, quantity=3)
+
+    def setUp(self):
+        cache.clear()
+        for local_cache in VersionedLocalCache.instances:
+            local_cache.expire()
+
+    def api_etag(self, **params):
+        return self.client.get(reverse('catalog:api_index', kwargs={'category_slug': 'all'}), params)['ETag']
+
+    def test_order_keeps_products_version(self):
+        # заказ меняет только остатки: кэш поиска и автодополнение не сбрасываются
+        version = get_version(PRODUCTS_VERSION_KEY)
+        etag = self.api_etag()
+        stock_etag = self.api_etag(fields='id,quantity')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.user, phone_number='1234567890')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 7)
+        self.assertEqual(get_version(PRODUCTS_VERSION_KEY), version)
+        self.assertEqual(self.api_etag(), etag)
+        self.assertNotEqual(self.api_etag(fields='id,quantity'), stock_etag)
+        self.assertGreater(get_product_modified('stol'), 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CheckoutLockTest(TransactionTestCase):
+    def setUp(self):
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        self.product = Products.objects.create(name='Стол', slug='stol', price=100, quantity=10, category=category)
+        self.buyer = User.objects.create_user('buyer', password='x')
+        self.shopper = User.objects.create_user('shopper', password='x')
+        Cart.objects.create(user=self.buyer, product=self.product, quantity=3)
+
+    def test_checkout_does_not_block_cart_inserts(self):
+        # заказ держит блокировку товара до коммита, вставка в cart со ссылкой на товар ждать не должна
+        locked, release = threading.Event(), threading.Event()
+        errors = []
+
+        def checkout():
+            try:
+                with transaction.atomic():
+                    place_order(self.buyer, phone_number='1234567890')
+                    locked.set()
+                    release.wait(10)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                locked.set()
+                connection.close()
+
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        try:
+            locked.wait(10)
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '2s'")
+                Cart.objects.add_product(self.product.id, user_id=self.shopper.id)
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Cart.objects.get(user=self.shopper).quantity, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 7)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConcurrentCheckoutTest(TransactionTestCase):
+    # уменьшенная копия manage.py stress_checkout: потокам нужны закоммиченные строки
+    threads = 8
+    users = 16
+    stock = 6
+
+    def setUp(self):
+        rnd = random.Random(0)
+        category = Categories.objects.create(name='Столы', slug='stoly')
+        self.products = Products.objects.bulk_create(
+            Products(name=f'Стол {i}', slug=f'stol-{i}', price=100, quantity=self.stock, category=category)
+            for i in range(4)
+        )
+        self.buyers = [User.objects.create_user(f'buyer-{i}', password='x') for i in range(self.users)]
+        for user in self.buyers:
+            # разный набор и порядок товаров у каждого: блокировки все равно берутся по id
+            Cart.objects.bulk_create(
+                Cart(user=user, product=product, quantity=rnd.randint(1, 3))
+                for product in rnd.sample(self.products, rnd.randint(1, len(self.products)))
+            )
+
+    def test_no_oversell_no_deadlock(self):
+        barrier = threading.Barrier(self.threads)
+        placed, out_of_stock, errors = [], [], []
+
+        def checkout(users):
+            try:
+                barrier.wait()
+                for user in users:
+                    try:
+                        place_order(user, phone_number='1234567890')
+                        placed.append(user.id)
+                    except CheckoutError:
+                        out_of_stock.append(user.id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=checkout, args=(self.buyers[i::self.threads],)) for i in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # взаимная блокировка или сбой транзакции пришли бы сюда исключением
+        self.assertEqual(errors, [])
+        self.assertEqual(len(placed) + len(out_of_stock), self.users)
+        self.assertTrue(placed)
+        self.assertTrue(out_of_stock)
+        sold = dict(OrderItem.objects.values_list('product').annotate(total=Sum('quantity')))
+        for product in Products.objects.filter(id__in=[product.id for product in self.products]):
+            with self.subTest(product=product.slug):
+                self.assertGreaterEqual(product.quantity, 0)
+                self.assertEqual(product.quantity + sold.get(product.id, 0), self.stock)
+        self.assertEqual(set(Order.objects.values_list('user_id', flat=True)), set(placed))
+        self.assertEqual(set(Cart.objects.values_list('user_id', flat=True)), set(out_of_stock))
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from carts.models import Cart
+from goods.models import Products
+from goods.utils import STOCK_VERSION_KEY, bump_version, touch_product
+from orders.models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def place_order(user, **order_fields):
+    """
+    Оформляет заказ из корзины пользователя за постоянное число запросов, сколько бы в ней ни было позиций.
+
+    Строки корзины вместе с товарами блокируются одним SELECT ... FOR NO KEY UPDATE в порядке id товара:
+    параллельные заказы одних и тех же товаров ждут друг друга (без взаимных блокировок)
+    и проверяют уже уменьшенный остаток, поэтому лишнего не продают. Ключи товаров не меняются,
+    поэтому FOR KEY SHARE, который берут вставки в cart со ссылкой на товар, не ждет конца заказа.
+    """
+    with transaction.atomic():
+        cart_items = list(
+            Cart.objects.filter(user=user).select_related('product').defer('product__search_vector')
+            .order_by('product_id').select_for_update(no_key=True)
+        )
+        if not cart_items:
+            raise CheckoutError('Корзина пуста')
+
+        shortages = [
+            f'{item.product.name} (в наличии {item.product.quantity})'
+            for item in cart_items if item.product.quantity < item.quantity
+        ]
+        if shortages:
+            raise CheckoutError(f'Недостаточное количество товара на складе: {", ".join(shortages)}')
+
+        order = Order.objects.create(user=user, **order_fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                name=item.product.name,
+                price=item.product.sell_price,
+                quantity=item.quantity,
+            )
+            for item in cart_items
+        ])
+        # все остатки одной командой; строки товаров уже заблокированы выше
+        Products.objects.filter(id__in=[item.product_id for item in cart_items]).update(
+            quantity=F('quantity') - Case(*[When(id=item.product_id, then=Value(item.quantity)) for item in cart_items])
+        )
+        Cart.objects.filter(id__in=[item.id for item in cart_items]).delete()
+
+        # update() не отправляет сигналов товаров; изменились только остатки, поэтому кэш поиска
+        # и автодополнение (PRODUCTS_VERSION_KEY) не сбрасываем, а отмечаем сами товары и версию остатков
+        slugs = [item.product.slug for item in cart_items]
+
+        def on_commit():
+            bump_version(STOCK_VERSION_KEY)
+            for slug in slugs:
+                touch_product(slug)
+
+        transaction.on_commit(on_commit)
+    return order
@@ -1,15 +1,12 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
 from django.shortcuts import render, redirect
-from django.forms import ValidationError
 from django.contrib import messages
 from django.urls import reverse_lazy
 from django.views.generic import FormView
 
-from carts.models import Cart
 from orders.forms import CreateOrderForm
-from orders.models import Order, OrderItem
+from orders.utils import CheckoutError, place_order
 
 
 class CreateOrderView(LoginRequiredMixin, FormView):
@@ -25,46 +22,19 @@ class CreateOrderView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         try:
-            with transaction.atomic():
-                user = self.request.user
-                cart_items = Cart.objects.filter(user=user)
+            place_order(
+                self.request.user,
+                phone_number=form.cleaned_data['phone_number'],
+                requires_delivery=form.cleaned_data['requires_delivery'],
+                delivery_address=form.cleaned_data['delivery_address'],
+                payment_on_get=form.cleaned_data['payment_on_get'],
+            )
+        except CheckoutError as e:
+            messages.error(self.request, str(e))
+            return redirect('orders:create_order')
 
-                if cart_items.exists():
-                    # создать заказ
-                    order = Order.objects.create(
-                        user=user,
-                        phone_number=form.cleaned_data['phone_number'],
-                        requires_delivery=form.cleaned_data['requires_delivery'],
-                        delivery_address=form.cleaned_data['delivery_address'],
-                        payment_on_get=form.cleaned_data['payment_on_get'],
-                    )
-                    # создать заказанные товары
-                    for cart_item in cart_items:
-                        product = cart_item.product
-                        name = cart_item.product.name
-                        price = cart_item.product.sell_price()
-                        quantity = cart_item.quantity
-
-                        if product.quantity < quantity:
-                            raise ValidationError(f'Недостаточное количество товара {name} на складе \
-                             В наличии- {product.quantity}')
-
-                        OrderItem.objects.create(
-                            order=order,
-                            product=product,
-                            name=name,
-                            price=price,
-                            quantity=quantity,
-                        )
-                        product.quantity -= quantity
-                        product.save()
-
-                    cart_items.delete()
-                    messages.success(self.request, 'Заказ оформлен')
-                    return redirect('user:profile')
-        except ValidationError as e:
-            messages.success(self.request, str(e))
-            return redirect('cart:order')
+        messages.success(self.request, 'Заказ оформлен')
+        return redirect('user:profile')
 
     def form_invalid(self, form):
         messages.error(self.request, 'Заполните все обязательные поля!!!')
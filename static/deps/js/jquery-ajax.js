@@ -18,12 +18,16 @@ $(document).ready(function () {
         // Из атрибута href берем ссылку на контроллер django
         var add_to_cart_url = $(this).attr("href");
 
+        // Если товар уже есть в корзине на странице, достаточно изменений (delta), иначе нужен весь фрагмент
+        var delta = $("[data-cart-line][data-product-id=" + product_id + "]").length ? 1 : 0;
+
         // делаем post запрос через ajax не перезагружая страницу
         $.ajax({
             type: "POST",
             url: add_to_cart_url,
             data: {
                 product_id: product_id,
+                delta: delta,
                 csrfmiddlewaretoken: $("[name=csrfmiddlewaretoken]").val(),
             },
             success: function (data) {
@@ -39,9 +43,8 @@ $(document).ready(function () {
                 cartCount++;
                 goodsInCartCount.text(cartCount);
 
-                // Меняем содержимое корзины на ответ от django (новый отрисованный фрагмент разметки корзины)
-                var cartItemsContainer = $("#cart-items-container");
-                cartItemsContainer.html(data.cart_items_html);
+                // Меняем содержимое корзины на ответ от django
+                updateCartItems(data);
 
             },
 
@@ -66,6 +69,10 @@ $(document).ready(function () {
         // Из атрибута href берем ссылку на контроллер django
         var remove_from_cart = $(this).attr("href");
 
+        // Если в корзине останутся другие позиции, достаточно изменений (delta);
+        // после последней нужен весь фрагмент (пустая корзина без кнопки оформления)
+        var delta = $("ul[data-cart-line]").not("[data-cart-line=" + cart_id + "]").length ? 1 : 0;
+
         // делаем post запрос через ajax не перезагружая страницу
         $.ajax({
 
@@ -73,6 +80,7 @@ $(document).ready(function () {
             url: remove_from_cart,
             data: {
                 cart_id: cart_id,
+                delta: delta,
                 csrfmiddlewaretoken: $("[name=csrfmiddlewaretoken]").val(),
             },
             success: function (data) {
@@ -88,9 +96,8 @@ $(document).ready(function () {
                 cartCount -= data.quantity_deleted;
                 goodsInCartCount.text(cartCount);
 
-                // Меняем содержимое корзины на ответ от django (новый отрисованный фрагмент разметки корзины)
-                var cartItemsContainer = $("#cart-items-container");
-                cartItemsContainer.html(data.cart_items_html);
+                // Меняем содержимое корзины на ответ от django
+                updateCartItems(data);
 
             },
 
@@ -103,8 +110,8 @@ $(document).ready(function () {
     // Теперь + - количества товара
     // Обработчик события для уменьшения значения
     $(document).on("click", ".decrement", function () {
-        // Берем ссылку на контроллер django из атрибута data-cart-change-url
-        var url = $(this).data("cart-change-url");
+        // Берем ссылку на контроллер django из атрибута data-cart-batch-url
+        var url = $(this).data("cart-batch-url");
         // Берем id корзины из атрибута data-cart-id
         var cartID = $(this).data("cart-id");
         // Ищем ближайшеий input с количеством
@@ -115,15 +122,15 @@ $(document).ready(function () {
         if (currentValue > 1) {
             $input.val(currentValue - 1);
             // Запускаем функцию определенную ниже
-            // с аргументами (id карты, новое количество, количество уменьшилось или прибавилось, url)
-            updateCart(cartID, currentValue - 1, -1, url);
+            // с аргументами (id карты, новое количество, url)
+            updateCart(cartID, currentValue - 1, url);
         }
     });
 
     // Обработчик события для увеличения значения
     $(document).on("click", ".increment", function () {
-        // Берем ссылку на контроллер django из атрибута data-cart-change-url
-        var url = $(this).data("cart-change-url");
+        // Берем ссылку на контроллер django из атрибута data-cart-batch-url
+        var url = $(this).data("cart-batch-url");
         // Берем id корзины из атрибута data-cart-id
         var cartID = $(this).data("cart-id");
         // Ищем ближайшеий input с количеством
@@ -134,17 +141,36 @@ $(document).ready(function () {
         $input.val(currentValue + 1);
 
         // Запускаем функцию определенную ниже
-        // с аргументами (id карты, новое количество, количество уменьшилось или прибавилось, url)
-        updateCart(cartID, currentValue + 1, 1, url);
+        // с аргументами (id карты, новое количество, url)
+        updateCart(cartID, currentValue + 1, url);
     });
 
-    function updateCart(cartID, quantity, change, url) {
+    // Быстрые клики +/- не отправляем по одному: копим итоговое количество по каждой позиции
+    // и отправляем все одним пакетным запросом, когда пользователь перестал кликать
+    var pendingChanges = {};
+    var pendingTimer;
+
+    function updateCart(cartID, quantity, url) {
+        pendingChanges[cartID] = quantity;
+        clearTimeout(pendingTimer);
+        pendingTimer = setTimeout(function () {
+            sendCartChanges(url);
+        }, 300);
+    }
+
+    function sendCartChanges(url) {
+        var operations = $.map(pendingChanges, function (quantity, cartID) {
+            return {op: "set", cart_id: cartID, quantity: quantity};
+        });
+        pendingChanges = {};
+
         $.ajax({
             type: "POST",
             url: url,
             data: {
-                cart_id: cartID,
-                quantity: quantity,
+                operations: JSON.stringify(operations),
+                // позиции уже на странице, весь фрагмент корзины не нужен
+                delta: 1,
                 csrfmiddlewaretoken: $("[name=csrfmiddlewaretoken]").val(),
             },
 
@@ -157,23 +183,75 @@ $(document).ready(function () {
                     successMessage.fadeOut(400);
                 }, 7000);
 
-                // Изменяем количество товаров в корзине
-                var goodsInCartCount = $("#goods-in-cart-count");
-                var cartCount = parseInt(goodsInCartCount.text() || 0);
-                cartCount += change;
-                goodsInCartCount.text(cartCount);
-
-                // Меняем содержимое корзины
-                var cartItemsContainer = $("#cart-items-container");
-                cartItemsContainer.html(data.cart_items_html);
+                // Меняем содержимое корзины и счетчик товаров
+                updateCartState(data);
 
             },
             error: function (data) {
-                console.log("Ошибка при добавлении товара в корзину");
+                console.log("Ошибка при изменении корзины");
             },
         });
     }
 
+    // Применяем ответ django к корзине на странице
+    function updateCartItems(data) {
+        // Полный ответ: новый отрисованный фрагмент разметки корзины
+        if (data.cart_items_html !== undefined) {
+            $("#cart-items-container").html(data.cart_items_html);
+            return;
+        }
+
+        // Ответ с delta=1: правим только измененную позицию и итоги
+        if (data.line) {
+            var line = $("[data-cart-line=" + data.line.id + "]");
+            line.find(".number").val(data.line.quantity);
+            line.find(".cart-line-price").text(data.line.line_price);
+        } else {
+            // позиции больше нет - убираем ее заголовок и строку
+            $("[data-cart-line=" + data.line_id + "]").remove();
+        }
+        updateCartTotals(data);
+    }
+
+    // То же для ответа пакетного запроса: позиции ищем по id товара
+    function updateCartState(data) {
+        if (data.cart_items_html !== undefined) {
+            $("#cart-items-container").html(data.cart_items_html);
+            return;
+        }
+
+        $.each(data.lines, function (i, line) {
+            var element = $("[data-cart-line][data-product-id=" + line.product_id + "]");
+            element.find(".number").val(line.quantity);
+            element.find(".cart-line-price").text(line.line_price);
+        });
+        $.each(data.removed, function (i, productID) {
+            $("[data-cart-line][data-product-id=" + productID + "]").remove();
+        });
+        updateCartTotals(data);
+    }
+
+    function updateCartTotals(data) {
+        $(".cart-total-quantity").text(data.total_quantity);
+        $(".cart-total-price").text(data.total_price);
+        $("#goods-in-cart-count").text(data.total_quantity);
+    }
+
+    // Подсказки в строке поиска: запрос отправляем, когда пользователь перестал печатать
+    var autocompleteTimer;
+    $(document).on("input", "[data-autocomplete-url]", function () {
+        var input = $(this);
+        clearTimeout(autocompleteTimer);
+        autocompleteTimer = setTimeout(function () {
+            $.get(input.data("autocomplete-url"), {q: input.val()}, function (data) {
+                var suggestions = $("#" + input.attr("list")).empty();
+                $.each(data.results, function (i, product) {
+                    suggestions.append($("<option>").attr("value", product.name));
+                });
+            });
+        }, 150);
+    });
+
     // Берем из разметки элемент по id - оповещения от django
     var notification = $('#notification');
     // И через 7 сек. убираем
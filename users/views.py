@@ -11,7 +11,7 @@ from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, UpdateView
 
 import orders
-from carts.models import Cart
+from carts.backends import promote_anonymous_cart
 from common.mixins import CacheMixins
 from orders.models import OrderItem, Order
 from users.forms import UserLoginForm, UserRegisterForm, ProfileForm
@@ -33,14 +33,10 @@ class UserLoginView(LoginView):
 
         if user:
             auth.login(self.request, user)
-            if session_key:
-                forgot_carts = Cart.objects.filter(user=user)
-                if forgot_carts.exists():
-                    forgot_carts.delete()
-                Cart.objects.filter(session_key=session_key).update(user=user)
+            promote_anonymous_cart(self.request, user, session_key)
 
-                messages.success(self.request, f'Вы вошли в аккаунт {user.username}')
-                return HttpResponseRedirect(self.get_success_url())
+            messages.success(self.request, f'Вы вошли в аккаунт {user.username}')
+            return HttpResponseRedirect(self.get_success_url())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -99,8 +95,7 @@ class UserRegisterView(CreateView):
             form.save()
             auth.login(self.request, user)
 
-        if session_key:
-            Cart.objects.filter(session_key=session_key).update(user=user)
+        promote_anonymous_cart(self.request, user, session_key)
         messages.success(self.request, f'Пользователь {user.username} зарегистрирован')
         return HttpResponseRedirect(self.success_url)
 
@@ -147,7 +142,7 @@ class UsrProfileView(LoginRequiredMixin, CacheMixins, UpdateView):
         orders = Order.objects.filter(user=self.request.user).prefetch_related(
             Prefetch(
                 'orderitem_set',
-                queryset=OrderItem.objects.select_related('product'),
+                queryset=OrderItem.objects.select_related('product').defer('product__search_vector'),
             )
         ).order_by('-id')
 